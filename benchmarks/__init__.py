@@ -0,0 +1,5 @@
+"""Benchmarks for the pipeline: synthetic portfolios, an offline data source and a timing suite.
+
+See benchmarks/__main__.py for how to run them and compare with a baseline,
+and benchmarks/imports.py for the startup time budget of each entry point.
+"""
@@ -0,0 +1,46 @@
+"""Run the benchmarks from the command line.
+
+Usage, from the repository root with the pipeline modules importable the way
+main.py expects them:
+
+    python -m benchmarks --size small --save baseline
+    python -m benchmarks --size small --compare baseline
+
+--compare exits with status 1 when any benchmark regressed.
+"""
+import sys
+
+import click
+
+from .results import compare, load_results, save_results
+from .suite import BENCHMARKS, SIZES, run_benchmarks
+
+
+@click.command()
+@click.option("--size", type=click.Choice(list(SIZES)), default="small", show_default=True)
+@click.option("--only", multiple=True, type=click.Choice(list(BENCHMARKS)), help="Run just these benchmarks.")
+@click.option("--repeat", default=5, show_default=True, help="Timed repeats per benchmark.")
+@click.option("--save", "label", help="Store the results under this label, e.g. baseline.")
+@click.option("--compare", "baseline", help="Compare with the results stored under this label.")
+@click.option("--tolerance", default=0.2, show_default=True, help="Slowdown allowed before flagging a regression.")
+def main(size, only, repeat, label, baseline, tolerance):
+    run = run_benchmarks(size, list(only) or None, repeat)
+    if label:
+        print(f"Saved {save_results(run, label)}")
+    if not baseline:
+        return
+
+    try:
+        stored = load_results(baseline, size)
+    except FileNotFoundError:
+        raise click.UsageError(f"No {size} results stored as {baseline!r}; run with --save {baseline} first.")
+
+    report = compare(run, stored, tolerance)
+    for name, (before, after, ratio, status) in report.items():
+        print(f"{name:<24} {before * 1000:10.2f} ms -> {after * 1000:10.2f} ms  x{ratio:5.2f}  {status}")
+    if any(status == "regression" for *_, status in report.values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
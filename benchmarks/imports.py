@@ -0,0 +1,91 @@
+"""imports.py - Check that importing the pipeline stays cheap.
+
+Short runs from cron spend most of their time starting up, so every target
+below is imported in a fresh interpreter, the way such a run starts, and
+checked against a time budget and a list of heavy modules it must leave
+alone until they are actually used.
+
+Usage, with the pipeline modules importable as for the suite:
+
+    python -m benchmarks.imports
+    python -m benchmarks.imports --scale 2    # on a slow machine
+
+Exits with status 1 when a target is over budget or imports a module it
+should not.
+"""
+import json
+import os
+import subprocess
+import sys
+from typing import Dict, NamedTuple, Tuple
+
+import click
+
+
+class Budget(NamedTuple):
+    seconds: float
+    forbidden: Tuple[str, ...]
+
+
+HEAVY = ("pygraphviz", "yfinance", "ccxt")
+
+BUDGETS: Dict[str, Budget] = {
+    "graph": Budget(0.05, HEAVY + ("pandas", "numpy")),
+    "pipelinerunner": Budget(0.15, HEAVY + ("pandas", "numpy")),
+    "pipeline2.daemon": Budget(0.05, HEAVY + ("pandas", "numpy")),
+    "pipeline2.market_data.registry": Budget(0.05, HEAVY + ("pandas", "numpy")),
+    # These need pandas, which dominates their budget.
+    "pipeline2.market_data.yahoo": Budget(0.75, HEAVY),
+    "pipeline2.market_data.kraken": Budget(0.75, HEAVY),
+    "main": Budget(0.75, HEAVY),
+}
+
+_CHILD = """
+import importlib, json, sys, time
+start = time.perf_counter()
+importlib.import_module(sys.argv[1])
+print(json.dumps({"seconds": time.perf_counter() - start, "modules": sorted(sys.modules)}))
+"""
+
+
+def measure(target: str, repeat: int = 3) -> Tuple[float, set]:
+    """Best import time of target over repeat fresh interpreters, and the modules it loaded."""
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join(path for path in sys.path if path)}
+    best, modules = None, set()
+    for _ in range(repeat):
+        done = subprocess.run([sys.executable, "-c", _CHILD, target], env=env, capture_output=True, text=True,
+                              check=True)
+        result = json.loads(done.stdout.splitlines()[-1])
+        best = result["seconds"] if best is None else min(best, result["seconds"])
+        modules = set(result["modules"])
+    return best, modules
+
+
+def check(repeat: int = 3, scale: float = 1.0) -> Dict[str, Tuple[float, float, list]]:
+    """Return target -> (seconds, budget, forbidden modules it loaded)."""
+    report = {}
+    for target, budget in BUDGETS.items():
+        seconds, modules = measure(target, repeat)
+        loaded = [name for name in budget.forbidden if name in modules]
+        report[target] = seconds, budget.seconds * scale, loaded
+    return report
+
+
+@click.command()
+@click.option("--repeat", default=3, show_default=True, help="Fresh interpreters per target; the best is kept.")
+@click.option("--scale", default=1.0, show_default=True, help="Multiply every time budget, for slow machines.")
+def main(repeat, scale):
+    failed = False
+    for target, (seconds, budget, loaded) in check(repeat, scale).items():
+        over = seconds > budget
+        failed = failed or over or bool(loaded)
+        status = "over budget" if over else "ok"
+        if loaded:
+            status = f"loads {', '.join(loaded)}"
+        print(f"{target:<34} {seconds * 1000:8.1f} ms  (budget {budget * 1000:6.0f} ms)  {status}")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
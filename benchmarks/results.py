@@ -0,0 +1,55 @@
+"""results.py - Store benchmark results and compare them with a baseline.
+
+Results are JSON files under benchmarks/results/, one per run, named
+<label>-<size>.json. A baseline is simply an earlier run, usually saved with
+the label "baseline" from the main branch.
+"""
+import json
+import os
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+
+def result_path(label, size, directory=RESULTS_DIR):
+    return os.path.join(directory, f"{label}-{size}.json")
+
+
+def save_results(run, label, directory=RESULTS_DIR):
+    """Write a run from run_benchmarks and return its path."""
+    os.makedirs(directory, exist_ok=True)
+    path = result_path(label, run["meta"]["size"], directory)
+    with open(path, "w") as f:
+        json.dump(run, f, indent=2)
+    return path
+
+
+def load_results(label, size, directory=RESULTS_DIR):
+    with open(result_path(label, size, directory)) as f:
+        return json.load(f)
+
+
+def compare(run, baseline, tolerance=0.2):
+    """Compare the median times of two runs.
+
+    Returns {name: (baseline seconds, current seconds, ratio, status)} where
+    status is "regression" if the current run is more than tolerance slower,
+    "improvement" if it is more than tolerance faster and "ok" otherwise.
+    Benchmarks missing from either run are left out.
+    """
+    if run["meta"]["size"] != baseline["meta"]["size"]:
+        raise ValueError(f"Cannot compare a {run['meta']['size']} run with a {baseline['meta']['size']} baseline.")
+
+    report = {}
+    for name, result in run["results"].items():
+        if name not in baseline["results"]:
+            continue
+        before, after = baseline["results"][name]["median"], result["median"]
+        ratio = after / before if before else float("inf")
+        if ratio > 1 + tolerance:
+            status = "regression"
+        elif ratio < 1 / (1 + tolerance):
+            status = "improvement"
+        else:
+            status = "ok"
+        report[name] = (before, after, ratio, status)
+    return report
@@ -0,0 +1,172 @@
+"""suite.py - The benchmarks and the code that times them.
+
+A benchmark is a function taking a Size and a scratch directory. It does its
+setup (generating data, writing files, building sources) and returns the
+callable to time, so setup never counts towards the result.
+"""
+import os
+import platform
+import statistics
+import tempfile
+import time
+from typing import Callable, Dict, NamedTuple
+
+import pandas as pd
+
+from node import Node
+from pipelinerunner import PipelineRunner
+from pipeline2.market_data.fake import FakeSource
+from pipeline2.market_data.scheduler import FetchScheduler
+from pipeline2.portfolio.csv import PORTFOLIO_SCHEMA, CsvPortfolio
+from pipeline2.processing.cost_basis import match_lots
+
+from .synthetic import make_portfolio, ticker_names, write_portfolio_csv
+
+
+class Size(NamedTuple):
+    transactions: int
+    tickers: int
+    nodes: int
+
+
+SIZES = {
+    "tiny": Size(10, 10, 10),
+    "small": Size(10_000, 100, 100),
+    "medium": Size(1_000_000, 1_000, 1_000),
+    "large": Size(10_000_000, 10_000, 5_000),
+}
+
+BENCHMARKS: Dict[str, Callable] = {}
+
+
+def benchmark(name):
+    """Register a benchmark under name."""
+    def register(func):
+        BENCHMARKS[name] = func
+        return func
+    return register
+
+
+class _Step(Node):
+    """Cheap node for graph benchmarks; adds one to its input(s)."""
+
+    def __init__(self, input_type=int):
+        super().__init__(input_type, int)
+
+    def process(self, _input):
+        if _input is None:
+            return 0
+        if isinstance(_input, tuple):
+            return sum(_input) + 1
+        return _input + 1
+
+
+def _layered_graph(n_nodes, width=8, batch=False):
+    """A head fanning out into `width` parallel chains that a final node joins.
+
+    With batch=True the edges go in through one connect_edges call.
+    """
+    runner = PipelineRunner()
+    head, join = _Step(None), _Step((int,))
+    runner.register_nodes([head, join])
+    length = max(1, (n_nodes - 2) // width)
+    edges = []
+    for _ in range(width):
+        parent = head
+        for _ in range(length):
+            node = _Step()
+            runner.register_node(node)
+            edges.append((parent, node))
+            parent = node
+        edges.append((parent, join))
+
+    if batch:
+        runner.connect_edges(edges)
+    else:
+        for parent, node in edges:
+            runner.connect_source(parent, node)
+    return runner
+
+
+@benchmark("graph_construction")
+def graph_construction(size, workdir):
+    return lambda: _layered_graph(size.nodes)
+
+
+@benchmark("graph_construction_batch")
+def graph_construction_batch(size, workdir):
+    return lambda: _layered_graph(size.nodes, batch=True)
+
+
+@benchmark("runner_run")
+def runner_run(size, workdir):
+    runner = _layered_graph(size.nodes)
+    return runner.run
+
+
+@benchmark("csv_ingest")
+def csv_ingest(size, workdir):
+    path = write_portfolio_csv(os.path.join(workdir, "portfolio.csv"), size.transactions, size.tickers)
+    node = CsvPortfolio(path, schema=PORTFOLIO_SCHEMA)
+    return lambda: node.process(None)
+
+
+def _cost_basis(method):
+    def setup(size, workdir):
+        df = make_portfolio(size.transactions, size.tickers)
+        return lambda: match_lots(df, method=method)
+    return setup
+
+
+for _method in ("fifo", "lifo", "average"):
+    benchmark(f"cost_basis_{_method}")(_cost_basis(_method))
+
+
+@benchmark("market_data_fetch")
+def market_data_fetch(size, workdir):
+    tickers = ticker_names(min(size.tickers, 500))
+
+    def fetch():
+        # A fresh scheduler each time so no request is coalesced with the last repeat.
+        scheduler = FetchScheduler(rate=10_000, burst=1_000, max_workers=16, base_delay=0.001)
+        source = FakeSource(latency=0.002, failure_rate=0.1, scheduler=scheduler)
+        source.download_historical_data(tickers, period="1y")
+        source.get_latest_prices(tickers)
+        scheduler.shutdown()
+
+    return fetch
+
+
+def run_benchmarks(size="small", names=None, repeat=5) -> dict:
+    """Time the named benchmarks (all by default) at one of SIZES.
+
+    Returns {"meta": {...}, "results": {name: {"min", "median", "repeat"}}}
+    with times in seconds.
+    """
+    if size not in SIZES:
+        raise ValueError(f"Unknown size {size!r}, expected one of {list(SIZES)}.")
+    names = list(BENCHMARKS) if names is None else names
+    unknown = [name for name in names if name not in BENCHMARKS]
+    if unknown:
+        raise ValueError(f"Unknown benchmarks {unknown}, expected some of {list(BENCHMARKS)}.")
+
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        for name in names:
+            call = BENCHMARKS[name](SIZES[size], workdir)
+            times = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                call()
+                times.append(time.perf_counter() - start)
+            results[name] = {"min": min(times), "median": statistics.median(times), "repeat": repeat}
+            print(f"{name:<24} min {min(times) * 1000:10.2f} ms   median {statistics.median(times) * 1000:10.2f} ms")
+
+    meta = {
+        "size": size,
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "machine": platform.machine(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+    return {"meta": meta, "results": results}
@@ -0,0 +1,64 @@
+"""synthetic.py - Reproducible portfolios of any size.
+
+Transactions are generated in chunks, each from its own seeded stream and
+covering its own slice of the date range, so a 10M row portfolio can be
+written to CSV without ever holding it in memory and the first rows of a
+big portfolio do not depend on how many rows follow.
+"""
+import numpy as np
+import pandas as pd
+
+COLUMNS = ["Ticker", "Date", "Action", "Quantity", "Price"]
+CHUNK_ROWS = 1_000_000
+
+
+def ticker_names(n_tickers):
+    """Return n_tickers distinct symbols, T0000, T0001, ..."""
+    width = max(4, len(str(n_tickers - 1)))
+    return [f"T{i:0{width}d}" for i in range(n_tickers)]
+
+
+def iter_portfolio(n_transactions, n_tickers, seed=0, start="2015-01-01", end="2024-12-31",
+                   chunk_rows=CHUNK_ROWS):
+    """Yield the portfolio as DataFrames of at most chunk_rows, in date order.
+
+    Roughly 70% of transactions are buys. Prices follow a per-ticker base
+    price with daily noise, quantities are whole shares from 1 to 100.
+    """
+    names = pd.Index(ticker_names(n_tickers))
+    base = np.random.default_rng([seed, 0]).uniform(10, 500, n_tickers)
+    first, last = pd.Timestamp(start).value, pd.Timestamp(end).value
+    n_chunks = max(1, -(-n_transactions // chunk_rows))
+
+    for i in range(n_chunks):
+        rows = min(chunk_rows, n_transactions - i * chunk_rows)
+        rng = np.random.default_rng([seed, i + 1])
+        window = np.linspace(first, last, n_chunks + 1).astype(np.int64)
+        dates = np.sort(rng.integers(window[i], window[i + 1], rows)).astype("datetime64[ns]").astype("datetime64[D]")
+        codes = rng.integers(0, n_tickers, rows)
+        yield pd.DataFrame({
+            "Ticker": pd.Categorical.from_codes(codes, categories=names),
+            "Date": dates,
+            "Action": pd.Categorical.from_codes((rng.random(rows) >= 0.7).astype(np.int8), categories=["Buy", "Sell"]),
+            "Quantity": rng.integers(1, 101, rows).astype(np.float64),
+            "Price": np.round(base[codes] * rng.lognormal(0, 0.1, rows), 2),
+        })
+
+
+def make_portfolio(n_transactions, n_tickers, seed=0, **kwargs):
+    """Return the whole synthetic portfolio as one DataFrame."""
+    return pd.concat(iter_portfolio(n_transactions, n_tickers, seed, **kwargs), ignore_index=True)
+
+
+def write_portfolio_csv(path, n_transactions, n_tickers, seed=0, currency=True, **kwargs):
+    """Write a synthetic portfolio to path, chunk by chunk.
+
+    With currency=True prices are written the way brokers export them,
+    e.g. "$1,234.50", so ingestion has to clean them.
+    """
+    with open(path, "w", newline="") as f:
+        for i, chunk in enumerate(iter_portfolio(n_transactions, n_tickers, seed, **kwargs)):
+            if currency:
+                chunk["Price"] = ["${:,.2f}".format(price) for price in chunk["Price"]]
+            chunk.to_csv(f, header=i == 0, index=False, columns=COLUMNS)
+    return path
@@ -2,6 +2,7 @@
 
 Usage:
     main3.py --filepath=<filepath>
+    main3.py <filepath> --interval=<seconds>    keep running, re-running on the interval and on file changes
 
 
 ?? - On disk representation, to be read in and updated by IRepository.
@@ -10,12 +11,24 @@ ICatalog - Contains a key-value store of IRepository objects.
 
 Pipeline - Contains a list of steps to be executed in order. This includes predefined steps and user-defined steps.
 """
+import itertools
+import os
+import pickle
+import shutil
+import sys
+import tempfile
 from abc import ABC
+from collections import OrderedDict
 
 import click
+import numpy as np
 import pandas as pd
 
-from pipeline2.market_data.yahoo import Yahoo
+from pipeline2.daemon import PipelineDaemon
+from pipeline2.market_data.quotes import QuoteCache
+from pipeline2.market_data.registry import create_source
+from pipeline2.portfolio.watch import PortfolioWatcher
+from pipeline2.reporting.create_report import analyze
 
 
 class IRepository(ABC):
@@ -52,78 +65,429 @@ class PortfolioCatalog(ICatalog):
         self.items[key] = value
 
 
+def _sizeof(value, seen=None) -> int:
+    """Rough in-memory size of value, following containers and object attributes."""
+    seen = set() if seen is None else seen
+    if id(value) in seen:
+        return 0
+    seen.add(id(value))
+
+    if isinstance(value, (pd.DataFrame, pd.Series, pd.Index)):
+        usage = value.memory_usage(deep=True)
+        return int(usage.sum() if hasattr(usage, "sum") else usage)
+    if isinstance(value, np.ndarray):
+        return int(value.nbytes)
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(_sizeof(k, seen) + _sizeof(v, seen) for k, v in value.items())
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        size += sum(_sizeof(item, seen) for item in value)
+    elif hasattr(value, "__dict__"):
+        size += _sizeof(vars(value), seen)
+    elif hasattr(value, "__slots__"):
+        size += sum(_sizeof(getattr(value, name), seen) for name in value.__slots__ if hasattr(value, name))
+    return size
+
+
+class SpillingCatalog(PortfolioCatalog):
+    """A PortfolioCatalog that keeps at most max_bytes of values in memory.
+
+    Entries are kept in least recently used order. When the resident values
+    outgrow the budget, the coldest are written to files under directory
+    and dropped from memory; get reads them back transparently. NumPy
+    arrays are saved as .npy and mapped copy-on-write when reloaded,
+    DataFrames as Parquet (pickle without pyarrow) and anything else is
+    pickled. The entry just set or read is never evicted, even when it alone
+    exceeds the budget, and neither is a value that cannot be written out
+    (one holding a lock, say); it stays resident and the next coldest entry
+    goes instead.
+
+    A value is written out when it is evicted, so changes made to it while
+    it was resident are kept; changes made through a reference held after
+    it was evicted are not, so get it again before changing it. Sizes are
+    measured when a value is set or read back, so set a value again after
+    growing it in place to keep resident_bytes honest.
+
+    Args:
+        max_bytes: Memory budget of the resident values.
+        directory: Where evicted values go. Defaults to a temporary
+            directory that close() removes.
+    """
+
+    def __init__(self, max_bytes: int, directory: str = None):
+        super().__init__()
+        self.max_bytes = max_bytes
+        self.items = OrderedDict()
+        self.sizes = {}
+        self.spilled = {}
+        self.resident_bytes = 0
+        self.stats = {"evictions": 0, "reloads": 0, "failed_spills": 0}
+        self._owns_directory = directory is None
+        self.directory = tempfile.mkdtemp(prefix="catalog-") if directory is None else directory
+        os.makedirs(self.directory, exist_ok=True)
+        self._names = itertools.count()
+
+    def __contains__(self, key):
+        return key in self.items or key in self.spilled
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def get(self, key):
+        if key in self.items:
+            self.items.move_to_end(key)
+            return self.items[key]
+        if key not in self.spilled:
+            return None
+
+        path = self.spilled.pop(key)
+        value = self._load(path)
+        self._remove(path)
+        self.stats["reloads"] += 1
+        self._admit(key, value)
+        return value
+
+    def set(self, key, value):
+        self.discard(key)
+        self._admit(key, value)
+
+    def discard(self, key):
+        """Forget key, in memory or on disk."""
+        if key in self.items:
+            del self.items[key]
+            self.resident_bytes -= self.sizes.pop(key)
+        if key in self.spilled:
+            self._remove(self.spilled.pop(key))
+
+    def close(self):
+        """Drop every entry and remove the spill files."""
+        for path in self.spilled.values():
+            self._remove(path)
+        self.items.clear()
+        self.sizes.clear()
+        self.spilled.clear()
+        self.resident_bytes = 0
+        if self._owns_directory:
+            shutil.rmtree(self.directory, ignore_errors=True)
+
+    def _admit(self, key, value):
+        size = _sizeof(value)
+        self.items[key] = value
+        self.sizes[key] = size
+        self.resident_bytes += size
+        # key is now the most recent entry, so it goes last and is never a candidate.
+        for cold in list(self.items)[:-1]:
+            if self.resident_bytes <= self.max_bytes:
+                break
+            try:
+                path = self._dump(self.items[cold])
+            except (pickle.PicklingError, TypeError, AttributeError, OSError):
+                # Keep it in memory rather than lose it.
+                self.stats["failed_spills"] += 1
+                continue
+            del self.items[cold]
+            self.resident_bytes -= self.sizes.pop(cold)
+            self.spilled[cold] = path
+            self.stats["evictions"] += 1
+
+    def _dump(self, value) -> str:
+        base = os.path.join(self.directory, str(next(self._names)))
+        if isinstance(value, np.ndarray) and not value.dtype.hasobject:
+            np.save(base + ".npy", value)
+            return base + ".npy"
+        if isinstance(value, pd.DataFrame):
+            try:
+                value.to_parquet(base + ".parquet")
+                return base + ".parquet"
+            except (ImportError, ValueError, TypeError):
+                # No Parquet engine, or columns Parquet cannot store.
+                self._remove(base + ".parquet")
+        try:
+            with open(base + ".pkl", "wb") as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        except BaseException:
+            self._remove(base + ".pkl")
+            raise
+        return base + ".pkl"
+
+    @staticmethod
+    def _load(path: str):
+        if path.endswith(".npy"):
+            return np.load(path, mmap_mode="c")
+        if path.endswith(".parquet"):
+            return pd.read_parquet(path, memory_map=True)
+        with open(path, "rb") as f:
+            return pickle.load(f)
+
+    @staticmethod
+    def _remove(path: str):
+        # A reloaded .npy stays mapped after its file is unlinked.
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+TRANSACTION_DTYPE = np.dtype([
+    ("ticker", np.int32),   # code into TransactionTable.tickers
+    ("date", np.int64),     # nanoseconds since the epoch
+    ("action", np.int16),   # code into TransactionTable.actions
+    ("quantity", np.float64),
+    ("price", np.float64),
+    ("seq", np.int64),      # position in the file, to write rows back in order
+])
+
+NS_PER_DAY = 86_400 * 10 ** 9
+
+
+def _intern(values: pd.Series, vocabulary: list) -> np.ndarray:
+    """Codes of values in vocabulary, appending values it does not have yet."""
+    # Factorize first so only the distinct values are looked up in Python.
+    codes, uniques = pd.factorize(values)
+    if len(codes) and codes.min() < 0:
+        # factorize codes missing values as -1, which would index the last slot.
+        raise ValueError(f"Cannot intern missing {values.name} values.")
+    slots = {value: i for i, value in enumerate(vocabulary)}
+    mapping = np.empty(len(uniques), dtype=np.int64)
+    for i, value in enumerate(map(str, uniques)):
+        if value not in slots:
+            slots[value] = len(vocabulary)
+            vocabulary.append(value)
+        mapping[i] = slots[value]
+    return mapping[codes]
+
+
 class Transaction:
-    """A single transaction for a given security."""
+    """A single transaction: a view of one row of a TransactionTable."""
+    __slots__ = ("table", "row")
 
-    def __init__(self, ticker, quantity, price, date, action):
-        self.ticker = ticker
-        self.quantity = quantity
-        self.price = price
-        self.date = date
-        self.action = action
+    def __init__(self, table, row):
+        self.table = table
+        self.row = row
 
     def __repr__(self):
         return f"Transaction({self.ticker}, {self.quantity}, {self.price}, {self.date}, {self.action})"
 
+    @property
+    def ticker(self):
+        return self.table.tickers[self.table.records["ticker"][self.row]]
+
+    @property
+    def quantity(self):
+        return float(self.table.records["quantity"][self.row])
+
+    @property
+    def price(self):
+        return float(self.table.records["price"][self.row])
+
+    @property
+    def date(self):
+        return pd.Timestamp(int(self.table.records["date"][self.row]))
+
+    @property
+    def action(self):
+        return self.table.actions[self.table.records["action"][self.row]]
+
 
 class Position:
-    """A set of transactions for a given security."""
+    """A set of transactions for a given security.
+
+    A view of the contiguous range [start, stop) of a TransactionTable;
+    Transaction objects are only built if someone asks for them.
+    """
+    __slots__ = ("table", "code", "start", "stop")
 
-    def __init__(self, ticker, transactions):
-        self.ticker = ticker
-        self.transactions = transactions
+    def __init__(self, table, code, start, stop):
+        self.table = table
+        self.code = code
+        self.start = start
+        self.stop = stop
 
     def __repr__(self):
         return f"Position({self.ticker}, {self.transactions})"
 
+    def __len__(self):
+        return self.stop - self.start
+
+    @property
+    def ticker(self):
+        return self.table.tickers[self.code]
+
+    @property
+    def transactions(self):
+        return [Transaction(self.table, row) for row in range(self.start, self.stop)]
+
     @property
     def time_held(self):
-        return (self.transactions[-1].date - self.transactions[0].date).days
+        dates = self.table.records["date"]
+        return int((dates[self.stop - 1] - dates[self.start]) // NS_PER_DAY)
 
     @property
     def cost_basis(self):
-        return sum([transaction.quantity * transaction.price for transaction in self.transactions])
+        records = self.table.records[self.start:self.stop]
+        return float(records["quantity"] @ records["price"])
+
+    @property
+    def status(self):
+        return "closed" if self.table.signed_quantity[self.start:self.stop].sum() == 0 else "open"
+
+
+class TransactionTable:
+    """Every transaction of a portfolio in one NumPy structured array.
+
+    Tickers and actions are interned: rows hold small integer codes into
+    the tickers and actions lists, and dates are int64 nanoseconds. Rows are
+    stably sorted by ticker code, so each ticker's transactions form one
+    contiguous range, [offsets[i], offsets[i + 1]), in file order. Positions
+    are views of those ranges and per-ticker aggregates reduce over the
+    ranges for every ticker at once; no per-row objects are created.
+    """
+
+    def __init__(self, records: np.ndarray, tickers: list, actions: list):
+        order = np.argsort(records["ticker"], kind="stable")
+        self.records = records[order]
+        self.tickers = tickers
+        self.actions = actions
+        self._codes = {ticker: code for code, ticker in enumerate(tickers)}
+        counts = np.bincount(self.records["ticker"], minlength=len(tickers))
+        self.offsets = np.concatenate([[0], np.cumsum(counts)])
+
+        sells = np.array([str(action).lower().startswith("sell") for action in actions], dtype=bool)
+        quantity = self.records["quantity"]
+        self.signed_quantity = np.where(sells[self.records["action"]], -quantity, quantity) if len(actions) \
+            else quantity.copy()
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, tickers: list = None, actions: list = None,
+                   first_seq: int = 0) -> "TransactionTable":
+        """Build a table from a frame with ticker, date, action, quantity and price columns."""
+        tickers = [] if tickers is None else tickers
+        actions = [] if actions is None else actions
+        return cls(cls._records(df, tickers, actions, first_seq), tickers, actions)
+
+    @staticmethod
+    def _records(df, tickers, actions, first_seq):
+        dates = pd.to_datetime(df["date"])
+        # A missing date would become the smallest int64 and sort as the oldest transaction.
+        missing = (df["ticker"].isna() | df["action"].isna() | dates.isna()).to_numpy()
+        if missing.any():
+            raise ValueError(f"{int(missing.sum())} transactions are missing a ticker, action or date, "
+                             f"the first at row {int(np.argmax(missing)) + first_seq}.")
+
+        records = np.empty(len(df), dtype=TRANSACTION_DTYPE)
+        records["ticker"] = _intern(df["ticker"], tickers)
+        records["date"] = dates.to_numpy(dtype="datetime64[ns]").view(np.int64)
+        records["action"] = _intern(df["action"], actions)
+        records["quantity"] = df["quantity"].to_numpy(dtype=float)
+        records["price"] = df["price"].to_numpy(dtype=float)
+        records["seq"] = np.arange(first_seq, first_seq + len(df))
+        return records
+
+    def append(self, df: pd.DataFrame) -> "TransactionTable":
+        """Return a new table with the rows of df added after the existing ones."""
+        tickers, actions = list(self.tickers), list(self.actions)
+        first_seq = int(self.records["seq"].max()) + 1 if len(self.records) else 0
+        records = self._records(df, tickers, actions, first_seq)
+        return TransactionTable(np.concatenate([self.records, records]), tickers, actions)
+
+    def __len__(self):
+        return len(self.records)
+
+    def __contains__(self, ticker):
+        return ticker in self._codes
+
+    def position(self, ticker) -> Position:
+        code = self._codes[ticker]
+        return Position(self, code, int(self.offsets[code]), int(self.offsets[code + 1]))
+
+    def positions(self) -> list:
+        return [Position(self, code, int(start), int(stop))
+                for code, (start, stop) in enumerate(zip(self.offsets[:-1], self.offsets[1:]))]
+
+    def to_frame(self) -> pd.DataFrame:
+        """The transactions as a frame, in file order."""
+        records = self.records[np.argsort(self.records["seq"], kind="stable")]
+        return pd.DataFrame({
+            "ticker": np.asarray(self.tickers, dtype=object)[records["ticker"]],
+            "date": records["date"].view("datetime64[ns]"),
+            "action": np.asarray(self.actions, dtype=object)[records["action"]],
+            "quantity": records["quantity"],
+            "price": records["price"],
+        })
+
+    def _reduce(self, values) -> pd.Series:
+        return pd.Series(np.add.reduceat(values, self.offsets[:-1]) if len(values) else values,
+                         index=self.tickers)
+
+    def cost_basis(self) -> pd.Series:
+        """Sum of quantity * price for every ticker."""
+        return self._reduce(self.records["quantity"] * self.records["price"])
+
+    def net_quantity(self) -> pd.Series:
+        """Shares still held of every ticker."""
+        return self._reduce(self.signed_quantity)
+
+    def time_held(self) -> pd.Series:
+        """Days between the first and last transaction of every ticker."""
+        if not len(self.records):
+            return pd.Series(dtype=float)
+        dates = self.records["date"]
+        return pd.Series((dates[self.offsets[1:] - 1] - dates[self.offsets[:-1]]) // NS_PER_DAY,
+                         index=self.tickers)
+
+    def status(self) -> pd.Series:
+        """Whether each ticker's position is "open" or "closed"."""
+        return pd.Series(np.where(self.net_quantity().to_numpy() == 0, "closed", "open"), index=self.tickers)
 
 
 class Portfolio(IRepository):
     def __init__(self, filepath):
         self.filepath = filepath
-        self.df = None
+        self.watcher = PortfolioWatcher(filepath, schema={"Date": "datetime", "Price": "currency"})
+        self.table = None
+        self.delta = None
         self.load()
 
-    def load_csv(self) -> pd.DataFrame:
-        df = pd.read_csv(self.filepath, parse_dates=["date".title()], converters={"price".title(): lambda x: float(x.replace('$', '').replace(',', ''))})
-        df.columns = df.columns.str.lower()
-        return df
-
     def load(self):
-        self.df = self.load_csv()
+        self.watcher.reset()
+        self.update()
 
     def save(self):
-        self.df.to_csv(self.filepath)
+        self.table.to_frame().rename(columns=str.title).to_csv(self.filepath, index=False)
 
     def update(self):
-        # Check if the file has changed
-        df = self.load_csv()
-
-        if not self.df.equals(df):
-            self.save()
+        """Apply what changed in the file since the last tick; returns False if nothing did."""
+        delta = self.delta = self.watcher.poll()
+        if delta.kind == "unchanged":
+            return False
+
+        rows = delta.rows.rename(columns=str.lower)
+        try:
+            self.table = TransactionTable.from_frame(rows) if delta.kind == "reloaded" else self.table.append(rows)
+        except ValueError:
+            # The watcher has moved past these rows; reload the whole file once it is fixed.
+            self.watcher.reset()
+            raise
+        return True
 
     @property
     def tickers(self) -> list[str]:
-        return self.df["ticker"].tolist()
+        return list(self.table.tickers)
 
     @property
     def cost_basis(self):
-        return (self.df["quantity"] * self.df["price"]).sum()
+        return float(self.table.cost_basis().sum())
 
     @property
     def positions(self):
-        """Return a list of positions."""
-        return [self.get_position(ticker) for ticker in self.tickers]
+        """Return a list of positions, one per ticker."""
+        return self.table.positions()
 
     def get_position(self, ticker):
-        return Position(ticker, [Transaction(row["ticker"], row["quantity"], row["price"], row["date"], row["action"]) for _, row in self.df.iterrows() if row["ticker"] == ticker])
+        return self.table.position(ticker)
 
 
 class Step(ABC):
@@ -138,9 +502,13 @@ class UpdatePortfolio(Step):
     def execute(self, catalog):
         portfolio = catalog.get("portfolio")
         if portfolio is None:
-            catalog.set("portfolio", Portfolio(self.filepath))
-        else:
-            portfolio.update()
+            portfolio = Portfolio(self.filepath)
+            catalog.set("portfolio", portfolio)
+        elif portfolio.update():
+            # Set it again so a catalog that tracks sizes sees how much it grew.
+            catalog.set("portfolio", portfolio)
+        # Downstream steps that only care about new transactions read this instead of the whole portfolio.
+        catalog.set("portfolio_delta", portfolio.delta)
 
 
 class Pipeline:
@@ -170,13 +538,38 @@ class Pipeline:
 class GetMarketData:
     """Get market data for all positions in the portfolio."""
 
+    def __init__(self, source=None):
+        # Keep one source so its quote cache survives between ticks.
+        self.source = source if source is not None else create_source("yahoo",
+                                                                       quote_cache=QuoteCache(ttl=60, stale_ttl=300))
+
     def execute(self, catalog):
         portfolio = catalog.get("portfolio")
-        data = Yahoo().download_historical_data(list(set(portfolio.tickers)))
+        tickers = list(set(portfolio.tickers))
+        data = self.source.download_historical_data(tickers)
 
         # TODO inspect output of download_historical_data and massage into a DataFrame
 
         catalog.set("market_data", data)
+        catalog.set("latest_prices", self.latest_prices(data, tickers))
+
+    def latest_prices(self, data, tickers):
+        """Last close of every ticker from the history just downloaded.
+
+        Only tickers the history has no close for are quoted separately, so a
+        tick normally makes no request beyond the history itself. A ticker
+        without either is None.
+        """
+        prices = {}
+        for ticker in tickers:
+            frame = data.get(ticker)
+            close = frame["Close"].dropna() if frame is not None and "Close" in frame else None
+            prices[ticker] = float(close.iloc[-1]) if close is not None and not close.empty else None
+        missing = [ticker for ticker, price in prices.items() if price is None]
+        if missing:
+            prices.update(self.source.get_latest_prices(missing))
+        return prices
+
 
 class CalculatePortfolioStats:
     """Calculate portfolio statistics; total cost basis, total market value, total gain/loss ($/%), etc."""
@@ -184,10 +577,14 @@ class CalculatePortfolioStats:
     def execute(self, catalog):
         market_data = catalog.get("market_data")
         print(market_data)
+        latest_prices = catalog.get("latest_prices")
         portfolio = catalog.get("portfolio")
+        # Every ticker at once: shares held times the latest quote, or the last close without one.
+        analytics = analyze(market_data, portfolio.table.net_quantity().to_dict(), prices=latest_prices)
+        catalog.set("analytics", analytics)
         portfolio_stats = {
-            "total_cost_basis": sum([position.cost_basis for position in portfolio.positions]),
-            "total_market_value": sum([market_data[ticker]["Close"].iloc[-1] for ticker in portfolio.tickers]),
+            "total_cost_basis": float(portfolio.table.cost_basis().sum()),
+            "total_market_value": float(analytics.summary["MarketValue"].sum()),
             "total_gain_loss": 0,
             "total_gain_loss_pct": 0,
         }
@@ -199,12 +596,19 @@ class CalculateStatsByTicker:
 
     def execute(self, catalog):
         portfolio = catalog.get("portfolio")
-        market_data = catalog.get("market_data")
+        latest_prices = catalog.get("latest_prices")
+        table = portfolio.table
+        # Aggregate every ticker in one pass instead of rebuilding each position.
+        cost_basis = table.cost_basis().to_dict()
+        time_held = table.time_held().to_dict()
+        status = table.status().to_dict()
+
         stats_by_ticker = {}
-        for ticker in portfolio.tickers:
-            position = portfolio.get_position(ticker)
-            stats = {}
-            if position.status == "closed":
+        for ticker in table.tickers:
+            if latest_prices.get(ticker) is None:
+                # No history and no quote this tick; it is reported again once one arrives.
+                continue
+            if status[ticker] == "closed":
                 # TODO complete this
                 # A position's stats are different when it is closed.
                 # Specifically, the cost_basis is the total buying cost of the position, and the gain_loss is the
@@ -212,10 +616,10 @@ class CalculateStatsByTicker:
                 pass
             else:
                 stats_by_ticker[ticker] = {
-                    "cost_basis": portfolio.get_position(ticker).cost_basis,
-                    "average_time_held": portfolio.get_position(ticker).time_held,
-                    "gain_loss": portfolio.get_position(ticker).cost_basis - market_data[ticker]["Close"].iloc[-1],
-                    "gain_loss_pct": portfolio.get_position(ticker).cost_basis / market_data[ticker]["Close"].iloc[-1],
+                    "cost_basis": cost_basis[ticker],
+                    "average_time_held": time_held[ticker],
+                    "gain_loss": cost_basis[ticker] - latest_prices[ticker],
+                    "gain_loss_pct": cost_basis[ticker] / latest_prices[ticker],
                 }
 
         catalog.set("stats_by_ticker", stats_by_ticker)
@@ -239,9 +643,11 @@ class ReportStatsByTicker:
 
 @click.command()
 @click.argument('filepath', type=click.Path(exists=True))
-def main(filepath):
+@click.option('--interval', type=float, help="Keep running, updating every this many seconds and when the file changes.")
+@click.option('--memory-budget', type=float, help="Megabytes of catalog data to keep in memory; colder entries go to disk.")
+def main(filepath, interval, memory_budget):
     # This will be shared between the various steps in the pipeline2.
-    catalog = PortfolioCatalog()
+    catalog = PortfolioCatalog() if memory_budget is None else SpillingCatalog(int(memory_budget * 2 ** 20))
 
     # init pipeline2
     pipeline = Pipeline(catalog)
@@ -264,7 +670,14 @@ def main(filepath):
     pipeline.show_execution_order()
 
     # run pipeline2
-    pipeline.run()
+    try:
+        if interval is None:
+            pipeline.run()
+        else:
+            PipelineDaemon(pipeline, interval=interval, watch=[filepath]).serve_forever()
+    finally:
+        if isinstance(catalog, SpillingCatalog):
+            catalog.close()
 
 
 if __name__ == '__main__':
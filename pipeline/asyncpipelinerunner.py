@@ -0,0 +1,79 @@
+import asyncio
+import inspect
+
+from node import Node
+from pipelinerunner import PipelineRunner
+
+
+class AsyncPipelineRunner(PipelineRunner):
+    """Runs the pipeline2 on a single asyncio event loop.
+
+    Nodes may define process as a coroutine (async def process); those run
+    concurrently on the loop, so network-bound nodes overlap their waits.
+    Plain nodes are handed to run_in_executor so they never block the loop.
+    With executor="processes", CPU-bound plain nodes go to the process pool.
+    """
+
+    def run(self):
+        """Run the pipeline2 to completion from synchronous code."""
+        return asyncio.run(self.run_async())
+
+    async def run_async(self):
+        """Run the pipeline2 from inside a running event loop.
+
+        Every node becomes a task that first awaits its parents' tasks, so a
+        node starts as soon as its own inputs are ready.
+        """
+        order = list(self.compile().nodes)
+        dirty, fingerprints = self._find_dirty(order)
+        tasks = {}
+        results = {}
+        digests = {}
+        remaining = self._consumers(order)
+        for node in order:
+            parents = [tasks[parent] for parent in self.graph.parents[node]]
+            tasks[node] = asyncio.create_task(self._run_async_node(node, parents, node in dirty, results, digests,
+                                                                   remaining))
+
+        try:
+            await asyncio.gather(*tasks.values())
+        except BaseException:
+            for task in tasks.values():
+                task.cancel()
+            raise
+
+        self._remember_run(fingerprints, results, digests)
+        return self.outputs
+
+    async def _run_async_node(self, node: Node, parents: list, is_dirty: bool, results: dict, digests: dict,
+                              remaining):
+        """Wait for the parents of node, then exec it and leave its output in results."""
+        await asyncio.gather(*parents)
+        if not is_dirty:
+            results[node] = self._reuse(node, digests)
+            return
+
+        key, hit, current_output = self._cache_lookup(node, digests)
+        _input = None if hit else self._gather_input(node, results)
+        self._release(node, results, remaining)
+        if hit:
+            self._keep(node, current_output, results, remaining)
+            self._record_output(node, current_output)
+            return
+
+        if inspect.iscoroutinefunction(node.process):
+            if self.profiler is None:
+                current_output = await node.process(_input)
+            else:
+                current_output = self._unwrap(await self.profiler.call_async(node, _input))
+        else:
+            loop = asyncio.get_running_loop()
+            if self.profiler is None:
+                current_output = await loop.run_in_executor(self._pool_for(node), node.process, _input)
+            else:
+                current_output = self._unwrap(await loop.run_in_executor(self._pool_for(node), self.profiler.call,
+                                                                         node, _input))
+
+        self._cache_store(node, key, current_output, digests)
+        self._keep(node, current_output, results, remaining)
+        self._record_output(node, current_output)
@@ -7,8 +7,17 @@ from pipeline2.node import Node
 
 
 class GetTickers(Node):
+    is_reducer = True
+
     def __init__(self):
         super().__init__(pd.DataFrame, List)
 
     def process(self, _input: pd.DataFrame) -> List:
         return _input['Ticker'].tolist()
+
+    def initial(self) -> List:
+        return []
+
+    def accumulate(self, state: List, batch: pd.DataFrame) -> List:
+        state.extend(self.process(batch))
+        return state
@@ -0,0 +1,222 @@
+"""cache.py - content-addressed cache of node results.
+
+A result is keyed by the node's class, its parameters (Node.cache_params) and
+the digests of its parents' outputs, so any change upstream produces a new
+key. Entries live in an in-memory LRU bounded by entry count and by size
+and, when a directory is given, in a pickle store on disk that is trimmed to
+a byte budget, oldest access first.
+"""
+import hashlib
+import os
+import pickle
+import sys
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from node import Node
+
+
+def digest(value: Any) -> str:
+    """Return a stable content hash of a node output."""
+    h = hashlib.sha256()
+    _update_digest(h, value)
+    return h.hexdigest()
+
+
+def _update_digest(h, value: Any):
+    if isinstance(value, (list, tuple)):
+        h.update(f"{type(value).__name__}:{len(value)}".encode())
+        for item in value:
+            _update_digest(h, item)
+        return
+
+    if isinstance(value, dict):
+        h.update(f"dict:{len(value)}".encode())
+        for key in sorted(value, key=repr):
+            h.update(repr(key).encode())
+            _update_digest(h, value[key])
+        return
+
+    # pandas objects hash much faster column-wise than through pickle.
+    if type(value).__module__.startswith("pandas"):
+        import pandas as pd
+
+        if isinstance(value, (pd.DataFrame, pd.Series, pd.Index)):
+            try:
+                h.update(pd.util.hash_pandas_object(value, index=True).values.tobytes())
+                h.update(repr(value.columns if isinstance(value, pd.DataFrame) else value.name).encode())
+                return
+            except TypeError:
+                # Unhashable cells (lists, dicts) fall through to pickle.
+                pass
+
+    h.update(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+
+
+def sizeof(value: Any) -> int:
+    """Rough in-memory size of a node output in bytes, following lists, tuples and dicts."""
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(sizeof(key) + sizeof(item) for key, item in value.items())
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(sizeof(item) for item in value)
+    if hasattr(value, "memory_usage") and hasattr(value, "shape"):
+        # DataFrame.memory_usage is per column, Series.memory_usage a scalar.
+        usage = value.memory_usage(deep=True)
+        return int(usage.sum() if hasattr(usage, "sum") else usage)
+    if hasattr(value, "nbytes"):
+        return int(value.nbytes)
+    return sys.getsizeof(value)
+
+
+class NodeCache:
+    """In-memory and on-disk LRU cache of node results.
+
+    Args:
+        directory: Where to persist entries as pickle files. None keeps the
+            cache in memory only.
+        max_entries: Number of results kept in memory.
+        max_memory_bytes: Size budget of the results kept in memory, as
+            measured by sizeof. The most recent result is kept even if it
+            alone is larger. None means only max_entries applies.
+        max_bytes: Size budget of the on-disk store. None means unbounded.
+        default_ttl: Seconds an entry stays valid for nodes that do not set
+            cache_ttl themselves. None means entries never expire.
+    """
+
+    def __init__(self, directory: Optional[str] = None, max_entries: int = 128, max_bytes: Optional[int] = None,
+                 default_ttl: Optional[float] = None, max_memory_bytes: Optional[int] = 256 * 2 ** 20):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.max_memory_bytes = max_memory_bytes
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self.stats: Dict[str, Dict[str, int]] = {}
+        self._memory: OrderedDict = OrderedDict()
+        self._memory_sizes: Dict[str, int] = {}
+        self.memory_bytes = 0
+
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    def key(self, node: Node, input_digest: str) -> str:
+        """Build the cache key of node given the digest of its input."""
+        cls = type(node)
+        params = sorted(node.cache_params().items())
+        return digest((f"{cls.__module__}.{cls.__qualname__}", repr(params), input_digest))
+
+    def get(self, node: Node, key: str) -> Tuple[bool, Optional[str], Any]:
+        """Look up a result, returning (hit, output digest, value)."""
+        entry = self._memory.get(key)
+        if entry is not None:
+            self._memory.move_to_end(key)
+        else:
+            entry = self._load(key)
+            if entry is not None:
+                self._remember(key, entry)
+
+        if entry is not None and entry[0] is not None and entry[0] < time.time():
+            self._forget(key)
+            entry = None
+
+        self._count(node, "hits" if entry is not None else "misses")
+        if entry is None:
+            return False, None, None
+        return True, entry[1], entry[2]
+
+    def put(self, node: Node, key: str, value: Any) -> str:
+        """Store the result of node and return the digest of the value."""
+        ttl = node.cache_ttl if node.cache_ttl is not None else self.default_ttl
+        entry = (time.time() + ttl if ttl is not None else None, digest(value), value)
+        self._remember(key, entry)
+        self._save(key, entry)
+        return entry[1]
+
+    def clear(self):
+        """Drop every entry from memory and disk."""
+        self._memory.clear()
+        self._memory_sizes.clear()
+        self.memory_bytes = 0
+        if self.directory is not None:
+            for name in os.listdir(self.directory):
+                if name.endswith(".pkl"):
+                    os.remove(os.path.join(self.directory, name))
+
+    def report(self) -> str:
+        """Format the per-node hit/miss counts."""
+        lines = [f"{node_id}: {counts['hits']} hits, {counts['misses']} misses"
+                 for node_id, counts in self.stats.items()]
+        return "\n".join(lines)
+
+    def _count(self, node: Node, outcome: str):
+        if node.id not in self.stats:
+            self.stats[node.id] = {"hits": 0, "misses": 0}
+        self.stats[node.id][outcome] += 1
+
+    def _remember(self, key: str, entry: tuple):
+        self._drop(key)
+        self._memory[key] = entry
+        if self.max_memory_bytes is not None:
+            self._memory_sizes[key] = sizeof(entry[2])
+            self.memory_bytes += self._memory_sizes[key]
+        while len(self._memory) > self.max_entries:
+            self._drop(next(iter(self._memory)))
+        while self.max_memory_bytes is not None and self.memory_bytes > self.max_memory_bytes \
+                and len(self._memory) > 1:
+            self._drop(next(iter(self._memory)))
+
+    def _drop(self, key: str):
+        """Remove key from the memory tier only."""
+        self._memory.pop(key, None)
+        self.memory_bytes -= self._memory_sizes.pop(key, 0)
+
+    def _forget(self, key: str):
+        self._drop(key)
+        if self.directory is not None:
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.pkl")
+
+    def _load(self, key: str) -> Optional[tuple]:
+        if self.directory is None:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                entry = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        # Touch the file so eviction sees it as recently used.
+        os.utime(path)
+        return entry
+
+    def _save(self, key: str, entry: tuple):
+        if self.directory is None:
+            return
+        path = self._path(key)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(entry, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+        self._evict()
+
+    def _evict(self):
+        """Remove the least recently used files until the store fits max_bytes."""
+        if self.max_bytes is None:
+            return
+        files = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".pkl"):
+                stat = os.stat(os.path.join(self.directory, name))
+                files.append((stat.st_mtime, stat.st_size, name))
+
+        total = sum(size for _, size, _ in files)
+        for _, size, name in sorted(files):
+            if total <= self.max_bytes:
+                break
+            os.remove(os.path.join(self.directory, name))
+            total -= size
@@ -0,0 +1,167 @@
+"""daemon.py - Keep a pipeline resident and re-run it on a timer or when its inputs change.
+
+A PipelineDaemon owns one PipelineRunner for the life of the process, so
+the compiled plan, the runner's worker pools, its NodeCache and any
+connections or quote caches held by the nodes stay warm between runs; a
+tick costs only the work the pipeline does.
+
+Runs are triggered by a fixed interval, by a change to any watched file
+(checked with one stat per file per poll) or by calling trigger from any
+thread, e.g. from a quote callback. Only one run is in flight at a time:
+
+- an interval tick that comes due while a run is in flight is skipped,
+- other triggers arriving meanwhile are coalesced into a single follow-up
+  run, so a burst of file writes or quotes costs at most one extra run.
+"""
+import os
+import threading
+import time
+import traceback
+from typing import Callable, Iterable, Optional
+
+
+def _stat_key(path: str):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+
+class PipelineDaemon:
+    """Re-run a PipelineRunner on an interval and on file or quote events.
+
+    Args:
+        runner: The runner to keep resident; anything with a run() method
+            works. Give a PipelineRunner a NodeCache, or make it incremental,
+            so unchanged nodes are not recomputed each tick, and
+            retain="latest" so outputs do not pile up.
+        interval: Seconds between scheduled runs; None runs only on events.
+        watch: Files whose changes trigger a run.
+        poll_interval: Seconds between checks of the watched files.
+        on_result: Called with (reason, outputs) after each successful run.
+        on_error: Called with (reason, exception) when a run raises; the
+            daemon keeps going. Defaults to printing the traceback.
+
+    Attributes:
+        runs, failures, skipped, coalesced: Counters since the daemon started.
+        last_duration: Seconds the most recent run took.
+    """
+
+    def __init__(self, runner, interval: Optional[float] = None, watch: Iterable[str] = (),
+                 poll_interval: float = 1.0, on_result: Callable = None, on_error: Callable = None):
+        if interval is not None and interval <= 0:
+            raise ValueError(f"interval must be positive, got {interval}.")
+        if poll_interval <= 0:
+            raise ValueError(f"poll_interval must be positive, got {poll_interval}.")
+
+        self.runner = runner
+        self.interval = interval
+        self.watch = list(watch)
+        self.poll_interval = poll_interval
+        self.on_result = on_result
+        self.on_error = on_error
+
+        self.runs = 0
+        self.failures = 0
+        self.skipped = 0
+        self.coalesced = 0
+        self.last_duration = None
+
+        self._lock = threading.Lock()
+        self._wake = threading.Condition(self._lock)
+        self._stop = threading.Event()
+        self._pending = None
+        self._running = False
+        self._file_keys = {}
+
+    def trigger(self, reason: str = "manual") -> bool:
+        """Ask for a run; returns False if one was already pending and this was folded into it."""
+        with self._lock:
+            if self._pending is not None:
+                self.coalesced += 1
+                return False
+            self._pending = reason
+            self._wake.notify()
+            return True
+
+    def stop(self):
+        """Make serve_forever return once the run in flight, if any, has finished."""
+        self._stop.set()
+        with self._lock:
+            self._wake.notify()
+
+    def serve_forever(self):
+        """Run the pipeline once, then on every trigger until stop or Ctrl-C."""
+        self._stop.clear()
+        # Compile up front so the first tick does not pay for it either.
+        if hasattr(self.runner, "compile"):
+            self.runner.compile()
+        self._file_keys = {path: _stat_key(path) for path in self.watch}
+
+        worker = threading.Thread(target=self._work, name="pipeline-daemon", daemon=True)
+        worker.start()
+        self.trigger("start")
+
+        next_tick = time.monotonic() + self.interval if self.interval else None
+        try:
+            while not self._stop.is_set():
+                now = time.monotonic()
+                if next_tick is not None and now >= next_tick:
+                    self._tick()
+                    # Ticks missed while a run overran are dropped, not replayed.
+                    while next_tick <= now:
+                        next_tick += self.interval
+                self._check_files()
+
+                timeouts = [self.poll_interval] if self.watch else []
+                if next_tick is not None:
+                    timeouts.append(next_tick - now)
+                self._stop.wait(min(timeouts) if timeouts else None)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+            worker.join()
+
+    def _tick(self):
+        with self._lock:
+            if self._running:
+                self.skipped += 1
+                return
+        self.trigger("interval")
+
+    def _check_files(self):
+        for path in self.watch:
+            key = _stat_key(path)
+            if key != self._file_keys[path]:
+                self._file_keys[path] = key
+                self.trigger(f"file:{path}")
+
+    def _work(self):
+        while True:
+            with self._lock:
+                while self._pending is None and not self._stop.is_set():
+                    self._wake.wait()
+                if self._stop.is_set():
+                    return
+                reason, self._pending = self._pending, None
+                self._running = True
+
+            start = time.perf_counter()
+            try:
+                outputs = self.runner.run()
+                self.runs += 1
+                if self.on_result is not None:
+                    self.on_result(reason, outputs)
+            except Exception as e:
+                self.failures += 1
+                if self.on_error is not None:
+                    self.on_error(reason, e)
+                else:
+                    print(f"Run triggered by {reason} failed:")
+                    traceback.print_exception(type(e), e, e.__traceback__)
+            finally:
+                with self._lock:
+                    self._running = False
+                    self.last_duration = time.perf_counter() - start
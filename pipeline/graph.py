@@ -1,6 +1,5 @@
-from typing import Dict, List
-
-import pygraphviz as pgv
+from collections import deque
+from typing import Dict, Iterable, List, Set, Tuple
 
 from node import Node
 
@@ -10,81 +9,205 @@ class Graph:
 
     There must be one or more input nodes and one or more output nodes. These
     can be any node, but they must be marked as input/output in the graph.
+
+    Children, parents and in-degrees are kept up to date on every change, so
+    adding a node or an edge and looking up the heads are O(1); only the
+    cycle check walks the graph, and only the part reachable from the new
+    edge's destination.
     """
     def __init__(self, cyclic=False):
         self.nodes: Dict[Node, List[Node]] = {}
+        self.parents: Dict[Node, List[Node]] = {}
+        self.in_degree: Dict[Node, int] = {}
         self.cyclic = cyclic
-        self.heads = []
+        # Insertion ordered set of the nodes without parents.
+        self._heads: Dict[Node, None] = {}
+        self._edges: Set[Tuple[Node, Node]] = set()
+        # Bumped on every change so compiled plans can tell they are stale.
+        self.version = 0
+
+    @classmethod
+    def restore(cls, nodes: List[Node], edges: Iterable[Tuple[Node, Node]], cyclic=False) -> "Graph":
+        """Rebuild a graph known to be valid, e.g. from an ExecutionPlan.
+
+        Types, duplicates and cycles are not checked again.
+        """
+        graph = cls(cyclic)
+        for node in nodes:
+            graph.add_node(node)
+        for node1, node2 in edges:
+            graph._add_edge(node1, node2)
+        return graph
+
+    @property
+    def heads(self) -> List[Node]:
+        """The nodes without inbound edges, in the order they were added."""
+        return list(self._heads)
 
     def find_heads(self) -> List[Node]:
         """Find the head of the graph. A head node has no inbound edges."""
-        heads = list(self.nodes)
-        for node, edges in self.nodes.items():
-            for edge in edges:
-                if edge in heads:
-                    heads.remove(edge)
-        return heads
+        return self.heads
 
     def add_node(self, node: Node):
+        """Add node to the graph; adding a node twice is a no-op."""
+        if node in self.nodes:
+            return
         self.nodes[node] = []
-
-        self.heads = self.find_heads()
+        self.parents[node] = []
+        self.in_degree[node] = 0
+        self._heads[node] = None
+        self.version += 1
 
     def connect(self, node1: Node, node2: Node):
+        self._check_edge(node1, node2)
+
+        # Check for cycles
+        if not self.cyclic and self._has_cycle(node1, node2):
+            raise ValueError(f"Cycle detected: {node1} -> {node2}")
+
+        self._add_edge(node1, node2)
+
+    def add_edges(self, edges: Iterable[Tuple[Node, Node]]):
+        """Connect many (parent, child) pairs, checking for cycles once at the end.
+
+        Types and duplicates are checked per edge as usual. If any edge is
+        rejected, or the edges would make the graph cyclic, ValueError is
+        raised and the graph is left exactly as it was: none of the edges
+        are kept, nodes they brought in are removed again and version is
+        restored.
+        """
+        version, heads = self.version, dict(self._heads)
+        added, new_nodes = [], {}
+        try:
+            for node1, node2 in edges:
+                self._check_edge(node1, node2)
+                new_nodes.update((node, None) for node in (node1, node2) if node not in self.nodes)
+                self._add_edge(node1, node2)
+                added.append((node1, node2))
+            if not self.cyclic:
+                self.topological_sort()
+        except ValueError:
+            try:
+                for node1, node2 in reversed(added):
+                    self._remove_edge(node1, node2)
+                for node in new_nodes:
+                    del self.nodes[node], self.parents[node], self.in_degree[node]
+            finally:
+                self._heads = heads
+                self.version = version
+            raise
+
+    def _check_edge(self, node1: Node, node2: Node):
+        if node1 is node2:
+            raise ValueError(f"Cannot connect a node to itself: {node1}")
+
         # Check node IO types
-        if node1.output_type != node2.input_type:
+        if not node2.accepts(node1.output_type):
             raise ValueError(f"Node types do not match: {node1.output_type} != {node2.input_type}")
 
         # Check if connection already exists
-        if node2 in self.nodes[node1]:
+        if (node1, node2) in self._edges:
             raise ValueError(f"Connection already exists: {node1} -> {node2}")
 
-        # Check for cycles
-        if not self.cyclic and self._has_cycle(node1, node2):
-            raise ValueError(f"Cycle detected: {node1} -> {node2}")
-
+    def _add_edge(self, node1: Node, node2: Node):
         # Add nodes if they don't exist
-        if node1 not in self.nodes:
-            self.add_node(node1)
+        self.add_node(node1)
+        self.add_node(node2)
 
-        if node2 not in self.nodes:
-            self.add_node(node2)
-
-        # Add connection
         self.nodes[node1].append(node2)
-
-        # Update heads
-        self.heads = self.find_heads()
+        self.parents[node2].append(node1)
+        self._edges.add((node1, node2))
+        self.in_degree[node2] += 1
+        self._heads.pop(node2, None)
+        self.version += 1
+
+    def _remove_edge(self, node1: Node, node2: Node):
+        self.nodes[node1].remove(node2)
+        self.parents[node2].remove(node1)
+        self._edges.discard((node1, node2))
+        self.in_degree[node2] -= 1
+        if self.in_degree[node2] == 0:
+            self._heads[node2] = None
+        self.version += 1
+
+    def topological_sort(self) -> List[Node]:
+        """Order the nodes so that every node comes after all of its parents.
+
+        Uses Kahn's algorithm, so the cost is O(V + E). Raises ValueError if
+        the graph contains a cycle.
+        """
+        in_degree = dict(self.in_degree)
+        ready = deque(node for node, degree in in_degree.items() if degree == 0)
+        order = []
+        while ready:
+            node = ready.popleft()
+            order.append(node)
+            for child in self.nodes[node]:
+                in_degree[child] -= 1
+                if in_degree[child] == 0:
+                    ready.append(child)
+
+        if len(order) != len(self.nodes):
+            raise ValueError("Graph contains a cycle and cannot be ordered.")
+        return order
 
     def _has_cycle(self, node1: Node, node2: Node) -> bool:
-        """Check if adding a connection would create a cycle."""
-        visited = set()
-        return self._has_cycle_helper(node1, node2, visited)
+        """Check if adding a connection would create a cycle.
 
-    def _has_cycle_helper(self, node1: Node, node2: Node, visited: set) -> bool:
-        """Recursive helper function for _has_cycle."""
+        That happens exactly when node1 can already be reached from node2.
+        Nodes outside the graph, a node1 without parents or a node2 without
+        children cannot close a loop, so the common cases of appending to or
+        starting a chain are answered without walking anything.
+        """
         if node1 == node2:
             return True
-
-        if node1 in visited:
+        if (node1 not in self.nodes or node2 not in self.nodes
+                or self.in_degree[node1] == 0 or not self.nodes[node2]):
             return False
 
-        visited.add(node1)
+        visited = {node2}
+        stack = [node2]
+        while stack:
+            for child in self.nodes[stack.pop()]:
+                if child == node1:
+                    return True
+                # A node without children cannot lead back to node1.
+                if child not in visited and self.nodes[child]:
+                    visited.add(child)
+                    stack.append(child)
+        return False
 
-        for node in self.nodes[node1]:
-            if self._has_cycle_helper(node, node2, visited):
-                return True
+    def print_graph(self, profile=None):
+        """Draw the graph to graph.png and open it.
 
-        return False
+        Pass a profiling.Profiler (or a dict of node id to seconds) to fill
+        each node in proportion to its share of the slowest node's wall time,
+        from white to red, and label it with the time taken.
+        """
+        # Only drawing needs graphviz, so running a graph never pays for importing it.
+        import subprocess
+
+        import pygraphviz as pgv
 
-    def print_graph(self):
         g = pgv.AGraph(directed=True, cyclic=False)
 
+        if profile is not None and not isinstance(profile, dict):
+            profile = profile.wall_times()
+        slowest = max((profile.get(node.id, 0.0) for node in self.nodes), default=0.0) if profile else 0.0
+
         for node, edges in self.nodes.items():
             g.add_node(node.id)
             n = g.get_node(node.id)
 
-            if node in self.heads:
+            if profile is not None and node.id in profile:
+                seconds = profile[node.id]
+                share = seconds / slowest if slowest else 0.0
+                n.attr['style'] = 'filled'
+                # Graphviz reads "H S V"; hue 0 is red and saturation grows with time spent.
+                n.attr['fillcolor'] = f"0.000 {share:.3f} 1.000"
+                n.attr['label'] = f"{node.id}\n{seconds * 1000:.1f} ms"
+
+            if node in self._heads:
                 n.attr['color'] = 'green'
 
             # elif node.is_output:
@@ -96,6 +219,4 @@ class Graph:
         g.layout('dot')
         g.draw('graph.png')
 
-        import subprocess
-
         subprocess.run(["xdg-open", "graph.png"])
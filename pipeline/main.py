@@ -29,15 +29,21 @@ app.run()
 """
 from typing import Type, List
 
-import pandas as pd
+import click
 
+from cache import NodeCache
+from daemon import PipelineDaemon
 from node import Node
 from pipeline2.base_processing.get_tickers import GetTickers
-from portfolio.csv import CsvPortfolio
+from portfolio.csv import PORTFOLIO_SCHEMA, CsvPortfolio
 from pipelinerunner import PipelineRunner
 
+DEFAULT_PORTFOLIO = "/home/albert/Finances/example_portfolio.csv"
+
 
 class OutputNode(Node):
+    cacheable = False
+
     def __init__(self, is_output: bool = True):
         super().__init__(List, None, is_output=is_output)
 
@@ -76,11 +82,15 @@ def main():
         v
     format_report
     """
-    app = PipelineRunner()
+    build_app(PipelineRunner(), DEFAULT_PORTFOLIO).run()
 
+
+def build_app(app: PipelineRunner, file_path: str) -> PipelineRunner:
+    """Register and connect the nodes of the pipeline on app."""
     # Create Nodes
-    portfolio = CsvPortfolio(file_path="/home/albert/Finances/example_portfolio.csv",
-                             col_check=["Ticker", "Date", "Action", "Quantity", "Price"])
+    portfolio = CsvPortfolio(file_path=file_path,
+                             col_check=["Ticker", "Date", "Action", "Quantity", "Price"],
+                             schema=PORTFOLIO_SCHEMA, sidecar=True)
     get_tickers = GetTickers()
     # split_ohlcv = GetOhlcv(list, list, is_output=True)
     output = OutputNode(is_output=True)
@@ -94,10 +104,34 @@ def main():
     # Connect Nodes
     app.connect_source(portfolio, get_tickers)
     app.connect_source(get_tickers, output)
+    return app
+
 
-    # Run App
-    app.run()
+@click.group(invoke_without_command=True)
+@click.pass_context
+def cli(ctx):
+    """Run the pipeline once, or keep it running with the daemon command."""
+    if ctx.invoked_subcommand is None:
+        main()
+
+
+@cli.command()
+@click.option("--portfolio", "file_path", default=DEFAULT_PORTFOLIO, show_default=True,
+              type=click.Path(exists=True), help="Portfolio CSV; changes to it trigger a run.")
+@click.option("--interval", type=float, help="Also run every this many seconds.")
+@click.option("--poll", "poll_interval", default=1.0, show_default=True,
+              help="Seconds between checks of the portfolio file.")
+@click.option("--executor", type=click.Choice(["threads", "processes"]), help="Run nodes in parallel.")
+def daemon(file_path, interval, poll_interval, executor):
+    """Keep the pipeline loaded and re-run it whenever the portfolio changes or the interval passes.
+
+    Imports, the compiled graph, worker pools and the node cache are set up
+    once, so each run only redoes the nodes whose inputs changed.
+    """
+    with PipelineRunner(executor=executor, cache=NodeCache(), retain="latest") as app:
+        build_app(app, file_path)
+        PipelineDaemon(app, interval=interval, watch=[file_path], poll_interval=poll_interval).serve_forever()
 
 
 if __name__ == '__main__':
-    main()
+    cli()
@@ -9,14 +9,24 @@ import time
 from abc import ABC, abstractmethod
 from random import random
 
+from .scheduler import get_scheduler, throttle_delay
+from ..profiling import record_retry
+
 
 def exponential_backoff(max_retries, base_delay, jitter, func, *args, **kwargs):
-    """Exponential backoff for a function that returns a value or None."""
+    """Exponential backoff for a function that returns a value or None.
+
+    When the error carries a Retry-After from the server we wait that long
+    instead of guessing.
+    """
     for attempt in range(max_retries):
         try:
             return func(*args, **kwargs)
         except Exception as e:
-            delay = (2 ** attempt + random() * jitter) * base_delay
+            _, retry_after = throttle_delay(e)
+            delay = retry_after if retry_after is not None else (2 ** attempt + random() * jitter) * base_delay
+            if attempt < max_retries - 1:
+                record_retry()
             print(f"Error: {e}. Retrying in {delay:.2f} seconds...")
             time.sleep(delay)
     print(f"Failed after {max_retries} attempts.")
@@ -24,7 +34,47 @@ def exponential_backoff(max_retries, base_delay, jitter, func, *args, **kwargs):
 
 
 class IDataSource(ABC):
-    """Abstract base class for sources to implement."""
+    """Abstract base class for sources to implement.
+
+    Implementations send their requests through self.scheduler. Every
+    instance of a source class shares one FetchScheduler, built from the
+    rate_limit (requests per second), burst and max_concurrency below, so
+    separate callers cannot together exceed what the provider allows.
+    """
+
+    rate_limit = 5.0
+    burst = 5
+    max_concurrency = 4
+
+    @property
+    def scheduler(self):
+        """The FetchScheduler this source sends its requests through."""
+        scheduler = getattr(self, "_scheduler", None)
+        if scheduler is None:
+            scheduler = get_scheduler(type(self).__name__, self.rate_limit, self.burst, self.max_concurrency)
+        return scheduler
+
+    @scheduler.setter
+    def scheduler(self, scheduler):
+        self._scheduler = scheduler
+
+    def request_key(self, *parts) -> tuple:
+        """Scheduler key of a request made by this instance.
+
+        Instances share their class's scheduler, so the key starts with
+        request_identity() and identical requests are only coalesced between
+        instances that would answer them alike.
+        """
+        return (self.request_identity(),) + parts
+
+    def request_identity(self):
+        """What sets this instance's answers apart; by default every instance is distinct.
+
+        Sources whose answers depend only on their configuration return that
+        configuration instead, so separately created but equal instances
+        still share requests.
+        """
+        return id(self)
 
     @abstractmethod
     def download_historical_data(self, tickers, period="1d"):
@@ -38,6 +88,22 @@ class IDataSource(ABC):
             Dict[str, pd.DataFrame]: A dictionary of DataFrames containing the historical data for each ticker.
         """
 
+    def download_range(self, tickers, start, end=None):
+        """Downloads bars between two dates for a list of tickers.
+
+        Sources that can fetch an explicit date range implement this so that
+        callers such as OhlcvStore only download the bars they are missing.
+
+        Args:
+            tickers (List[str]): A list of ticker symbols to download data for.
+            start (datetime): First date to include.
+            end (datetime, optional): Date to stop before. Defaults to now.
+
+        Returns:
+            Dict[str, pd.DataFrame]: A dictionary of DataFrames containing the historical data for each ticker.
+        """
+        raise NotImplementedError
+
     @abstractmethod
     def get_latest_price(self, ticker):
         """Gets the latest price for a single ticker.
@@ -49,6 +115,31 @@ class IDataSource(ABC):
             float: The latest price for the ticker.
         """
 
+    def get_latest_prices(self, tickers):
+        """Gets the latest price for many tickers at once.
+
+        Served from self.quote_cache when the source has one, so repeated
+        valuations within its TTL cost no requests.
+
+        Args:
+            tickers (List[str]): The ticker symbols to get the latest price for.
+
+        Returns:
+            Dict[str, float]: The latest price for each ticker, None where it could not be fetched.
+        """
+        quote_cache = getattr(self, "quote_cache", None)
+        if quote_cache is None:
+            return self.fetch_latest_prices(list(set(tickers)))
+        return quote_cache.get_many(tickers, self.fetch_latest_prices)
+
+    def fetch_latest_prices(self, tickers):
+        """Fetch the latest prices for a list of tickers, bypassing any quote cache.
+
+        Sources with a multi-symbol quote endpoint should override this; the
+        default asks for one ticker at a time.
+        """
+        return {ticker: self.get_latest_price(ticker) for ticker in tickers}
+
     @abstractmethod
     def get_securities(self):
         """Get a list of all securities available from the source.
@@ -0,0 +1,130 @@
+"""fake.py - Deterministic offline data source for benchmarks and local runs.
+
+Prices are a seeded random walk per ticker over a fixed business-day
+calendar, so the same ticker and date always give the same bar no matter how
+the request is sliced. Every request goes through the source's scheduler
+like a real provider, sleeps for a configurable latency and fails with a
+configurable probability, which exercises the retry and rate-limit paths
+without touching the network.
+"""
+import random
+import threading
+import time
+import zlib
+
+import numpy as np
+import pandas as pd
+
+from .IDataSource import IDataSource
+from .store import period_start
+
+OHLCV_COLUMNS = ["Open", "High", "Low", "Close", "Volume"]
+
+
+class FakeSourceError(ConnectionError):
+    """A simulated transient failure."""
+
+
+class FakeSource(IDataSource):
+    """Offline IDataSource with simulated latency and failures.
+
+    Args:
+        seed: Seeds prices and failures; equal seeds give equal runs.
+        latency: Seconds every request takes.
+        failure_rate: Probability that an attempt fails. Which attempts fail
+            depends only on the seed, the request and how often it was tried.
+        first_date: First bar of the calendar.
+        last_date: Last bar of the calendar; stands in for "now".
+        scheduler: FetchScheduler to send requests through. Defaults to the
+            one shared by every FakeSource.
+    """
+
+    rate_limit = 1000.0
+    burst = 1000
+    max_concurrency = 16
+
+    def __init__(self, seed=0, latency=0.0, failure_rate=0.0, first_date="2015-01-01", last_date="2024-12-31",
+                 scheduler=None):
+        self.seed = seed
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.calendar = pd.bdate_range(first_date, last_date, name="Date")
+        self.requests = 0
+        self._attempts = {}
+        self._lock = threading.Lock()
+        if scheduler is not None:
+            self.scheduler = scheduler
+
+    def get_securities(self):
+        return []
+
+    def download_historical_data(self, tickers, period="1d"):
+        start = period_start(period, self.calendar[-1])
+        futures = {ticker: self._submit(("history", ticker, period), self._bars, ticker, start, None)
+                   for ticker in set(tickers)}
+        return {ticker: future.result() for ticker, future in futures.items()}
+
+    def download_ticker_data(self, ticker, period="1d"):
+        return self.download_historical_data([ticker], period)[ticker]
+
+    def download_range(self, tickers, start, end=None):
+        futures = {ticker: self._submit(("range", ticker, start, end), self._bars, ticker, start, end)
+                   for ticker in set(tickers)}
+        return {ticker: future.result() for ticker, future in futures.items()}
+
+    def get_latest_price(self, ticker):
+        return self.fetch_latest_prices([ticker])[ticker]
+
+    def fetch_latest_prices(self, tickers):
+        """One simulated bulk quote request for every ticker."""
+        tickers = sorted(set(tickers))
+        prices = self._submit(("quotes", tuple(tickers)), self._quotes, tickers).result()
+        return prices if prices is not None else {ticker: None for ticker in tickers}
+
+    def request_identity(self):
+        """Instances with the same seed, calendar and failure rate answer alike."""
+        return self.seed, self.failure_rate, self.calendar[0], self.calendar[-1]
+
+    def _submit(self, key, func, *args):
+        return self.scheduler.submit(self.request_key(*key), lambda: self._request(key, func, *args))
+
+    def _request(self, key, func, *args):
+        """Simulate one round trip: count it, wait, maybe fail, then answer."""
+        with self._lock:
+            self.requests += 1
+            attempt = self._attempts.get(key, 0)
+            self._attempts[key] = attempt + 1
+
+        if self.latency:
+            time.sleep(self.latency)
+        if random.Random(f"{self.seed}:{key}:{attempt}").random() < self.failure_rate:
+            raise FakeSourceError(f"Simulated failure of {key}")
+        return func(*args)
+
+    def _closes(self, ticker):
+        """Close prices of ticker over the whole calendar."""
+        rng = np.random.default_rng([self.seed, zlib.crc32(ticker.encode())])
+        start = rng.uniform(10, 500)
+        return start * np.exp(np.cumsum(rng.normal(0.0002, 0.02, len(self.calendar))))
+
+    def _bars(self, ticker, start=None, end=None):
+        close = self._closes(ticker)
+        rng = np.random.default_rng([self.seed, zlib.crc32(ticker.encode()), 1])
+        spread = np.abs(rng.normal(0, 0.01, (2, len(close))))
+        frame = pd.DataFrame({
+            "Open": np.concatenate([[close[0]], close[:-1]]),
+            "High": close * (1 + spread[0]),
+            "Low": close * (1 - spread[1]),
+            "Close": close,
+            "Volume": rng.integers(1_000, 1_000_000, len(close)),
+        }, index=self.calendar)
+
+        mask = np.ones(len(frame), dtype=bool)
+        if start is not None:
+            mask &= frame.index >= pd.Timestamp(start)
+        if end is not None:
+            mask &= frame.index < pd.Timestamp(end)
+        return frame[mask]
+
+    def _quotes(self, tickers):
+        return {ticker: float(self._closes(ticker)[-1]) for ticker in tickers}
@@ -1,14 +1,26 @@
 """Get financial data from Kraken API."""
+from functools import partial
 
-import ccxt
-from DataSources.IDataSource import IDataSource, exponential_backoff
+import pandas as pd
+
+from .IDataSource import IDataSource
+
+OHLCV_COLUMNS = ["Open", "High", "Low", "Close", "Volume"]
 
 
 class Kraken(IDataSource):
     """A source for financial data from Kraken API."""
 
+    # Kraken's public endpoints allow roughly one call per second.
+    rate_limit = 1.0
+    burst = 1
+    max_concurrency = 2
+
     def __init__(self, key, secret):
-        self.exchange = ccxt.kraken
+        # ccxt takes a long time to import; only pay for it when Kraken is used.
+        import ccxt
+
+        self.exchange = ccxt.kraken({"apiKey": key, "secret": secret})
 
     def get_securities(self):
         """Get a list of all securities available from the source."""
@@ -24,11 +36,52 @@ class Kraken(IDataSource):
         Returns:
             Dict[str, pd.DataFrame]: A dictionary of DataFrames containing the historical data for each ticker.
         """
-        data = {}
-        for ticker in set(tickers):
-            data[ticker] = self.download_ticker_data(ticker, period)
-        return data
+        futures = {ticker: self._submit_ohlcv(ticker, period) for ticker in set(tickers)}
+        return {ticker: future.result() for ticker, future in futures.items()}
 
     def download_ticker_data(self, ticker, period="1d"):
         """Downloads historical data for a single ticker with exponential backoff."""
-        return exponential_backoff(5, 1, 0.1, self.exchange.fetch_ohlcv, ticker, period)
\ No newline at end of file
+        return self._submit_ohlcv(ticker, period).result()
+
+    def get_latest_price(self, ticker):
+        """Gets the last traded price for a single ticker."""
+        return self.fetch_latest_prices([ticker])[ticker]
+
+    def fetch_latest_prices(self, tickers):
+        """Fetch the last traded price of every ticker with one fetch_tickers call."""
+        tickers = sorted(set(tickers))
+        call = partial(self.exchange.fetch_tickers, tickers)
+        quotes = self.scheduler.submit(self.request_key("tickers", tuple(tickers)), call).result() or {}
+        return {ticker: quotes[ticker].get("last") if ticker in quotes else None for ticker in tickers}
+
+    def _submit_ohlcv(self, ticker, timeframe, since=None):
+        """Queue a fetch_ohlcv call on the scheduler."""
+        call = partial(self.exchange.fetch_ohlcv, ticker, timeframe, since)
+        return self.scheduler.submit(self.request_key("ohlcv", ticker, timeframe, since), call)
+
+    def download_range(self, tickers, start, end=None, timeframe="1d"):
+        """Downloads daily bars from start up to, but not including, end.
+
+        Kraken pages OHLCV results, so we keep asking from the last bar seen
+        until we pass end or the exchange has nothing newer.
+        """
+        since = int(pd.Timestamp(start).timestamp() * 1000)
+        until = int(pd.Timestamp(end).timestamp() * 1000) if end is not None else None
+
+        data = {}
+        for ticker in set(tickers):
+            rows = []
+            cursor = since
+            while True:
+                page = self._submit_ohlcv(ticker, timeframe, cursor).result()
+                page = [row for row in page or [] if row[0] >= cursor and (until is None or row[0] < until)]
+                if not page:
+                    break
+                rows.extend(page)
+                cursor = page[-1][0] + 1
+
+            frame = pd.DataFrame([row[1:] for row in rows], columns=OHLCV_COLUMNS,
+                                 index=pd.to_datetime([row[0] for row in rows], unit="ms"))
+            frame.index.name = "Date"
+            data[ticker] = frame
+        return data
@@ -0,0 +1,85 @@
+"""quotes.py - In-process cache of latest prices.
+
+Quotes younger than ttl are served from memory. Between ttl and
+ttl + stale_ttl the cached quote is still served, but a background refresh
+is started so the next caller sees a fresh one (stale-while-revalidate).
+Anything older, or never seen, is fetched before returning, all missing
+tickers in one bulk call.
+"""
+import threading
+import time
+
+
+class QuoteCache:
+    """Latest-price cache with a TTL and stale-while-revalidate refresh.
+
+    Args:
+        ttl: Seconds a quote is considered fresh.
+        stale_ttl: Further seconds a quote may be served while it refreshes
+            in the background. 0 disables stale serving.
+    """
+
+    def __init__(self, ttl=60.0, stale_ttl=0.0):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._quotes = {}
+        self._refreshing = set()
+        self._lock = threading.Lock()
+
+    def get_many(self, tickers, fetch_many):
+        """Return {ticker: price}, calling fetch_many(tickers) for what is missing.
+
+        fetch_many takes a list of tickers and returns a dict of prices; it is
+        called at most once synchronously, plus once in the background for
+        stale quotes.
+        """
+        now = time.monotonic()
+        prices = {}
+        missing = []
+        stale = []
+        with self._lock:
+            for ticker in set(tickers):
+                quote = self._quotes.get(ticker)
+                age = now - quote[1] if quote is not None else None
+                if age is not None and age < self.ttl:
+                    prices[ticker] = quote[0]
+                elif age is not None and age < self.ttl + self.stale_ttl:
+                    prices[ticker] = quote[0]
+                    if ticker not in self._refreshing:
+                        self._refreshing.add(ticker)
+                        stale.append(ticker)
+                else:
+                    missing.append(ticker)
+
+        if stale:
+            threading.Thread(target=self._refresh, args=(stale, fetch_many), daemon=True).start()
+        if missing:
+            fetched = self._store(fetch_many(missing))
+            prices.update({ticker: fetched.get(ticker) for ticker in missing})
+        return prices
+
+    def invalidate(self, tickers=None):
+        """Forget the given tickers, or every quote when tickers is None."""
+        with self._lock:
+            if tickers is None:
+                self._quotes.clear()
+            else:
+                for ticker in tickers:
+                    self._quotes.pop(ticker, None)
+
+    def _refresh(self, tickers, fetch_many):
+        try:
+            self._store(fetch_many(tickers))
+        finally:
+            with self._lock:
+                self._refreshing.difference_update(tickers)
+
+    def _store(self, prices):
+        """Remember the prices that came back; failed tickers (None) are not cached."""
+        prices = prices or {}
+        now = time.monotonic()
+        with self._lock:
+            for ticker, price in prices.items():
+                if price is not None:
+                    self._quotes[ticker] = (price, now)
+        return prices
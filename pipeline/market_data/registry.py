@@ -0,0 +1,64 @@
+"""registry.py - Look up data sources by name without importing every provider.
+
+Providers are registered as "module:attribute" strings, so naming a source
+imports only that provider's module (and its client library, e.g. yfinance
+or ccxt) the first time it is asked for. Other packages can add sources
+through the "pipeline.data_sources" entry point group, or by calling
+register at runtime.
+"""
+import importlib
+from typing import Dict, List, Union
+
+ENTRY_POINT_GROUP = "pipeline.data_sources"
+
+_SOURCES: Dict[str, Union[str, type]] = {
+    "yahoo": f"{__package__}.yahoo:Yahoo",
+    "kraken": f"{__package__}.kraken:Kraken",
+    "fake": f"{__package__}.fake:FakeSource",
+}
+_plugins_loaded = False
+
+
+def register(name: str, source: Union[str, type], replace: bool = False):
+    """Register a source class, or a "module:attribute" path to import it from when first used."""
+    if name in _SOURCES and not replace:
+        raise ValueError(f"A data source named {name!r} is already registered.")
+    _SOURCES[name] = source
+
+
+def _load_plugins():
+    global _plugins_loaded
+    if _plugins_loaded:
+        return
+    _plugins_loaded = True
+    # importlib.metadata is slow to import and only needed to find plugins.
+    from importlib.metadata import entry_points
+
+    for entry_point in entry_points(group=ENTRY_POINT_GROUP):
+        # Registered names win, so a plugin cannot shadow a built in source.
+        _SOURCES.setdefault(entry_point.name, entry_point.value)
+
+
+def available() -> List[str]:
+    """Names of every registered source, plugins included."""
+    _load_plugins()
+    return sorted(_SOURCES)
+
+
+def get_source(name: str) -> type:
+    """Return the source class registered under name, importing it if needed."""
+    if name not in _SOURCES:
+        _load_plugins()
+    if name not in _SOURCES:
+        raise ValueError(f"Unknown data source {name!r}, expected one of {available()}.")
+
+    source = _SOURCES[name]
+    if isinstance(source, str):
+        module, _, attribute = source.partition(":")
+        source = _SOURCES[name] = getattr(importlib.import_module(module), attribute)
+    return source
+
+
+def create_source(name: str, *args, **kwargs):
+    """Instantiate the source registered under name with the given arguments."""
+    return get_source(name)(*args, **kwargs)
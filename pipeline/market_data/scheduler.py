@@ -0,0 +1,173 @@
+"""scheduler.py - Rate-limited, concurrent request scheduler for data sources.
+
+Every IDataSource subclass shares one FetchScheduler per provider. It keeps
+requests under the provider's rate with a token bucket, caps how many run at
+once, lets duplicate requests that are already in flight share a single
+call, and backs off for as long as the server asks when it throttles us.
+"""
+import contextvars
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
+from random import random
+
+from ..profiling import record_retry
+
+# Exception class names that providers use for "slow down". Matching by name
+# keeps yfinance and ccxt optional here.
+THROTTLE_ERRORS = ("RateLimit", "TooManyRequests", "DDoSProtection")
+
+
+class ThrottledError(Exception):
+    """Raised by a fetch function when the server asked us to slow down."""
+
+    def __init__(self, message="Throttled by server", retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def throttle_delay(exc):
+    """Work out whether exc is a throttling signal.
+
+    Returns (throttled, seconds); seconds is None when the server did not
+    say how long to wait.
+    """
+    retry_after = getattr(exc, "retry_after", None)
+    throttled = isinstance(exc, ThrottledError) or any(name in type(exc).__name__ for name in THROTTLE_ERRORS)
+
+    response = getattr(exc, "response", None)
+    if response is not None:
+        if getattr(response, "status_code", None) == 429:
+            throttled = True
+        headers = getattr(response, "headers", None) or {}
+        if retry_after is None:
+            retry_after = headers.get("Retry-After")
+
+    if retry_after is None:
+        return throttled, None
+    try:
+        return True, float(retry_after)
+    except (TypeError, ValueError):
+        # Retry-After may also be an HTTP date.
+        try:
+            return True, max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return True, None
+
+
+class TokenBucket:
+    """Thread-safe token bucket; acquire blocks until a request may go out."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+
+                if now < self._paused_until:
+                    wait = self._paused_until - now
+                elif self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                else:
+                    wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        """Hold every request back for seconds, e.g. after a 429."""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._tokens = 0.0
+
+
+class FetchScheduler:
+    """Runs fetches for one provider under a rate limit and concurrency cap.
+
+    Args:
+        rate: Requests per second allowed on average.
+        burst: Requests that may go out back to back after an idle spell.
+        max_workers: Requests allowed in flight at once.
+        max_retries: Attempts per request before giving up.
+        base_delay: Seconds of the first backoff; doubles each attempt.
+        jitter: Random fraction added to each backoff.
+    """
+
+    def __init__(self, rate=5.0, burst=5, max_workers=4, max_retries=5, base_delay=1, jitter=0.1):
+        self.bucket = TokenBucket(rate, burst)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.jitter = jitter
+        self._pool = ThreadPoolExecutor(max_workers=max_workers)
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    def submit(self, key, call, max_retries=None, base_delay=None, jitter=None) -> Future:
+        """Schedule call(), or join the identical request already in flight.
+
+        key identifies the request, e.g. ("history", ticker, period); while a
+        request with the same key is running, later submits get its future
+        rather than a second call. The future resolves to None if every
+        attempt fails, like exponential_backoff.
+        """
+        with self._lock:
+            future = self._in_flight.get(key)
+            if future is not None:
+                return future
+
+            # Run in the caller's context so retries are profiled against its node.
+            future = self._pool.submit(contextvars.copy_context().run, self._attempt, call,
+                                       self.max_retries if max_retries is None else max_retries,
+                                       self.base_delay if base_delay is None else base_delay,
+                                       self.jitter if jitter is None else jitter)
+            self._in_flight[key] = future
+
+        future.add_done_callback(lambda _: self._done(key, future))
+        return future
+
+    def shutdown(self):
+        self._pool.shutdown()
+
+    def _done(self, key, future):
+        with self._lock:
+            if self._in_flight.get(key) is future:
+                del self._in_flight[key]
+
+    def _attempt(self, call, max_retries, base_delay, jitter):
+        for attempt in range(max_retries):
+            self.bucket.acquire()
+            try:
+                return call()
+            except Exception as e:
+                throttled, retry_after = throttle_delay(e)
+                delay = retry_after if retry_after is not None else (2 ** attempt + random() * jitter) * base_delay
+                if throttled:
+                    # The whole provider is telling us to slow down, not just this request.
+                    self.bucket.pause(delay)
+                if attempt < max_retries - 1:
+                    record_retry()
+                    print(f"Error: {e}. Retrying in {delay:.2f} seconds...")
+                    time.sleep(delay)
+        print(f"Failed after {max_retries} attempts.")
+        return None
+
+
+_schedulers = {}
+_schedulers_lock = threading.Lock()
+
+
+def get_scheduler(name, rate=5.0, burst=5, max_workers=4) -> FetchScheduler:
+    """Return the scheduler shared by every source called name, creating it on first use."""
+    with _schedulers_lock:
+        if name not in _schedulers:
+            _schedulers[name] = FetchScheduler(rate, burst, max_workers)
+        return _schedulers[name]
@@ -0,0 +1,215 @@
+"""store.py - Local OHLCV store that sits in front of any IDataSource.
+
+Bars are kept per interval and ticker as one memory-mapped NumPy file per
+column:
+
+    <directory>/<interval>/<ticker>/index.npy    int64 nanoseconds since epoch
+    <directory>/<interval>/<ticker>/Close.npy    ... one file per column
+    <directory>/<interval>/<ticker>/meta.json    range covered and column order
+
+A request only goes to the wrapped source for the dates the store has not
+covered yet, so once warm a daily run downloads a single new bar per ticker.
+"""
+import json
+import os
+from urllib.parse import quote
+
+import numpy as np
+import pandas as pd
+
+from .IDataSource import IDataSource
+
+# Yahoo style period strings mapped to how far back they reach. "max" has no
+# lower bound.
+PERIODS = {
+    "1d": pd.DateOffset(days=1),
+    "5d": pd.DateOffset(days=5),
+    "1mo": pd.DateOffset(months=1),
+    "3mo": pd.DateOffset(months=3),
+    "6mo": pd.DateOffset(months=6),
+    "1y": pd.DateOffset(years=1),
+    "2y": pd.DateOffset(years=2),
+    "5y": pd.DateOffset(years=5),
+    "10y": pd.DateOffset(years=10),
+}
+
+
+def period_start(period, now=None):
+    """Return the first date a period string covers, or None for "max"."""
+    now = pd.Timestamp.now().normalize() if now is None else now
+    if period == "max":
+        return None
+    if period == "ytd":
+        return pd.Timestamp(year=now.year, month=1, day=1)
+    if period not in PERIODS:
+        raise ValueError(f"Unknown period {period!r}, expected one of {list(PERIODS) + ['ytd', 'max']}.")
+    return now - PERIODS[period]
+
+
+class OhlcvStore(IDataSource):
+    """Read-through OHLCV cache for an IDataSource.
+
+    Args:
+        source: The IDataSource to fetch missing bars from. Sources that
+            implement download_range are asked for the missing dates only;
+            others are asked for the whole period and merged.
+        directory: Root directory of the store.
+        interval: Bar size of the data the source returns. Used to keep
+            different bar sizes apart on disk.
+    """
+
+    def __init__(self, source: IDataSource, directory: str, interval: str = "1d"):
+        self.source = source
+        self.directory = directory
+        self.interval = interval
+
+    def get_securities(self):
+        """Get a list of all securities available from the source."""
+        return self.source.get_securities()
+
+    def get_latest_price(self, ticker):
+        """Gets the latest price for a single ticker."""
+        return self.source.get_latest_price(ticker)
+
+    def fetch_latest_prices(self, tickers):
+        """Quotes are not stored; ask the source in bulk."""
+        return self.source.fetch_latest_prices(tickers)
+
+    def download_historical_data(self, tickers, period="1d"):
+        """Return bars for each ticker, fetching only what the store is missing."""
+        now = pd.Timestamp.now().normalize()
+        start = period_start(period, now)
+        tickers = sorted(set(tickers))
+        metas = {ticker: self._read_meta(ticker) for ticker in tickers}
+
+        # Group tickers by the range they are missing so each range is one request.
+        gaps = {}
+        for ticker in tickers:
+            for gap in self._missing(metas[ticker], start, now):
+                gaps.setdefault(gap, []).append(ticker)
+
+        for (gap_start, gap_end), gap_tickers in gaps.items():
+            fetched = self._fetch(gap_tickers, gap_start, gap_end, period)
+            for ticker in gap_tickers:
+                # Re-read the meta; an earlier gap of this ticker may have widened it.
+                self._merge(ticker, self._read_meta(ticker), fetched.get(ticker), gap_start, now)
+
+        data = {}
+        for ticker in tickers:
+            frame = self.load(ticker)
+            if frame is not None and start is not None:
+                # The period starts at midnight wherever the bars are stamped.
+                first = start if frame.index.tz is None else start.tz_localize(frame.index.tz)
+                frame = frame[frame.index >= first]
+            data[ticker] = frame
+        return data
+
+    def load(self, ticker):
+        """Load every stored bar of a ticker, or None if nothing is stored."""
+        meta = self._read_meta(ticker)
+        frame = self._load_utc(ticker, meta)
+        if frame is not None and meta["tz"] is not None:
+            frame.index = frame.index.tz_localize("UTC").tz_convert(meta["tz"])
+        return frame
+
+    def _load_utc(self, ticker, meta):
+        """Load the stored bars with the naive UTC index they are kept in."""
+        if meta is None:
+            return None
+
+        path = self._path(ticker)
+        index = np.load(os.path.join(path, "index.npy"), mmap_mode="r")
+        columns = {column: np.load(os.path.join(path, f"{column}.npy"), mmap_mode="r")
+                   for column in meta["columns"]}
+        return pd.DataFrame(columns, index=pd.DatetimeIndex(index.view("datetime64[ns]"), name="Date"))
+
+    def _missing(self, meta, start, now):
+        """Ranges of dates a request needs that the store has not covered."""
+        if meta is None:
+            return [(start, None)]
+
+        covered_start = pd.Timestamp(meta["start"]) if meta["start"] is not None else None
+        covered_end = pd.Timestamp(meta["end"])
+        gaps = []
+        if covered_start is not None and (start is None or start < covered_start):
+            gaps.append((start, covered_start))
+        if covered_end < now:
+            # Re-fetch the last covered day too; its bar may have been partial.
+            gaps.append((covered_end, None))
+        return gaps
+
+    def _fetch(self, tickers, start, end, period):
+        try:
+            if start is not None:
+                return self.source.download_range(tickers, start, end)
+        except NotImplementedError:
+            pass
+        return self.source.download_historical_data(tickers, period)
+
+    def _merge(self, ticker, meta, frame, gap_start, now):
+        """Fold freshly fetched bars into the stored ones and widen the covered range."""
+        if frame is None:
+            # The fetch failed; leave the covered range alone so the next run retries.
+            return
+
+        tz = meta["tz"] if meta is not None else None
+        stored = self._load_utc(ticker, meta)
+        if not frame.empty:
+            frame = frame.copy()
+            if isinstance(frame.columns, pd.MultiIndex):
+                # Newer yfinance keeps a ticker level even for single symbols.
+                frame.columns = frame.columns.get_level_values(0)
+            if frame.index.tz is not None:
+                tz = str(frame.index.tz)
+                frame.index = frame.index.tz_convert("UTC").tz_localize(None)
+            stored = frame if stored is None else pd.concat([stored, frame])
+            stored = stored[~stored.index.duplicated(keep="last")].sort_index()
+
+        if stored is None:
+            return
+
+        if meta is None:
+            covered_start = gap_start
+        elif meta["start"] is None or gap_start is None:
+            covered_start = None
+        else:
+            covered_start = min(pd.Timestamp(meta["start"]), gap_start)
+        self._write(ticker, stored, covered_start, now, tz)
+
+    def _write(self, ticker, frame, covered_start, covered_end, tz):
+        path = self._path(ticker)
+        os.makedirs(path, exist_ok=True)
+
+        self._save_array(path, "index", frame.index.as_unit("ns").asi8)
+
+        columns = [str(column) for column in frame.columns]
+        for column, name in zip(frame.columns, columns):
+            self._save_array(path, name, frame[column].to_numpy())
+
+        meta = {
+            "start": covered_start.isoformat() if covered_start is not None else None,
+            "end": covered_end.isoformat(),
+            "columns": columns,
+            "tz": tz,
+        }
+        tmp_path = os.path.join(path, "meta.json.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, os.path.join(path, "meta.json"))
+
+    @staticmethod
+    def _save_array(path, name, values):
+        # Write next to the target and rename, so readers never see half a file.
+        tmp_path = os.path.join(path, f"{name}.tmp.npy")
+        np.save(tmp_path, np.ascontiguousarray(values))
+        os.replace(tmp_path, os.path.join(path, f"{name}.npy"))
+
+    def _read_meta(self, ticker):
+        try:
+            with open(os.path.join(self._path(ticker), "meta.json")) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _path(self, ticker):
+        return os.path.join(self.directory, self.interval, quote(ticker, safe=""))
@@ -1,20 +1,52 @@
 """Source financial data from Yahoo Finance."""
+import asyncio
 import time
+from functools import partial
 from random import random
 from typing import List
 
 import pandas as pd
-import yfinance as yf
 from abc import ABC, abstractmethod
-from .IDataSource import IDataSource, exponential_backoff
+from .IDataSource import IDataSource
 from ..node import Node
+from ..profiling import record_retry
+
+
+def _yfinance():
+    """Import yfinance on first use; it is slow to import and most runs never touch Yahoo."""
+    import yfinance
+
+    return yfinance
+
+
+def _download(*args, **kwargs):
+    return _yfinance().download(*args, **kwargs)
 
 
 class Yahoo(IDataSource):
-    """A source for financial data from Yahoo Finance."""
+    """A source for financial data from Yahoo Finance.
 
-    def __init__(self):
-        pass
+    Args:
+        downloader: Callable with the signature of yf.download used for every
+            history request. Swap it for a local stub to run offline.
+        chunk_size: When set, download_historical_data requests this many
+            tickers per multi-symbol call instead of one call per ticker.
+        scheduler: FetchScheduler to send requests through. Defaults to the
+            one shared by every Yahoo instance.
+        quote_cache: QuoteCache that get_latest_prices serves from. Share one
+            between instances to keep quotes across runs.
+    """
+
+    def __init__(self, downloader=None, chunk_size=None, scheduler=None, quote_cache=None):
+        self.downloader = downloader if downloader is not None else _download
+        self.chunk_size = chunk_size
+        self.quote_cache = quote_cache
+        if scheduler is not None:
+            self.scheduler = scheduler
+
+    def request_identity(self):
+        """Instances with the same downloader get the same answers."""
+        return self.downloader
 
     def get_securities(self):
         """Get a list of all securities available from the source."""
@@ -22,33 +54,191 @@ class Yahoo(IDataSource):
         raise NotImplementedError
 
     def download_historical_data(self, tickers, period="1d", max_retries=5, base_delay=1, jitter=0.1):
-        """Downloads historical data for a list of tickers with exponential backoff."""
-        data = {}
-        for ticker in set(tickers):
-            data[ticker] = self.download_ticker_data(ticker, period, max_retries, base_delay, jitter)
-        return data
+        """Downloads historical data for a list of tickers with exponential backoff.
+
+        Tickers are fetched concurrently through the scheduler.
+        """
+        if self.chunk_size:
+            return self.download_batched_data(tickers, period, max_retries, base_delay, jitter)
+
+        futures = {ticker: self._submit_history(ticker, {"period": period}, max_retries, base_delay, jitter)
+                   for ticker in set(tickers)}
+        return {ticker: future.result() for ticker, future in futures.items()}
 
     def download_ticker_data(self, ticker, period="1d", max_retries=5, base_delay=1, jitter=0.1):
         """Downloads historical data for a single ticker with exponential backoff."""
-        return exponential_backoff(max_retries, base_delay, jitter, yf.download, ticker, period=period, auto_adjust=True)
+        return self._submit_history(ticker, {"period": period}, max_retries, base_delay, jitter).result()
+
+    def download_batched_data(self, tickers, period="1d", max_retries=5, base_delay=1, jitter=0.1):
+        """Downloads historical data in multi-symbol chunks of chunk_size tickers.
+
+        After each pass only the chunks whose request failed are sent again;
+        a ticker the answer has no rows for, like a delisted symbol, maps to
+        None straight away rather than being retried. Tickers that still fail
+        after max_retries map to None too, like download_ticker_data.
+        """
+        return self._download_batched(tickers, {"period": period}, max_retries, base_delay, jitter)
+
+    def download_range(self, tickers, start, end=None, max_retries=5, base_delay=1, jitter=0.1):
+        """Downloads bars from start up to, but not including, end for a list of tickers."""
+        request = {"start": start, "end": end}
+        if self.chunk_size:
+            return self._download_batched(tickers, request, max_retries, base_delay, jitter)
+
+        futures = {ticker: self._submit_history(ticker, request, max_retries, base_delay, jitter)
+                   for ticker in set(tickers)}
+        return {ticker: future.result() for ticker, future in futures.items()}
+
+    def _submit_history(self, ticker, request, max_retries, base_delay, jitter):
+        """Queue a single-ticker history request on the scheduler."""
+        key = self.request_key("history", ticker, tuple(sorted(request.items())))
+        call = partial(self.downloader, ticker, auto_adjust=True, **request)
+        return self.scheduler.submit(key, call, max_retries, base_delay, jitter)
+
+    def _download_batched(self, tickers, request, max_retries, base_delay, jitter):
+        """Shared retry loop of download_batched_data and download_range."""
+        chunk_size = self.chunk_size or len(tickers) or 1
+        pending = sorted(set(tickers))
+        data = {}
+
+        for attempt in range(max_retries):
+            submitted = []
+            for start in range(0, len(pending), chunk_size):
+                chunk = pending[start:start + chunk_size]
+                key = self.request_key("batch", tuple(chunk), tuple(sorted(request.items())))
+                call = partial(self.downloader, chunk, auto_adjust=True, group_by="ticker", progress=False, **request)
+                # One attempt per pass; this loop retries just the symbols that failed.
+                submitted.append((chunk, self.scheduler.submit(key, call, max_retries=1)))
+
+            failed = []
+            for chunk, future in submitted:
+                frame = future.result()
+                if frame is None:
+                    # The request itself failed; try these symbols again.
+                    failed.extend(chunk)
+                    continue
+                # A symbol the answer has no rows for (delisted, say) will not
+                # turn up on a retry either.
+                data.update(self._split_batch(frame, chunk))
+
+            pending = failed
+            if not pending:
+                return data
+
+            if attempt < max_retries - 1:
+                record_retry()
+                delay = (2 ** attempt + random() * jitter) * base_delay
+                print(f"Retrying {len(pending)} tickers in {delay:.2f} seconds...")
+                time.sleep(delay)
+
+        print(f"Failed after {max_retries} attempts: {pending}")
+        for ticker in pending:
+            data[ticker] = None
+        return data
+
+    @staticmethod
+    def _split_batch(frame, chunk):
+        """Split a multi-symbol download into one frame per ticker, None for missing ones."""
+        if frame is None or frame.empty:
+            return {ticker: None for ticker in chunk}
+
+        if not isinstance(frame.columns, pd.MultiIndex):
+            # A single-symbol request can come back without the ticker level.
+            return {chunk[0]: frame.dropna(how="all")} if len(chunk) == 1 else {ticker: None for ticker in chunk}
+
+        split = {}
+        available = set(frame.columns.get_level_values(0))
+        for ticker in chunk:
+            ticker_frame = frame[ticker].dropna(how="all") if ticker in available else None
+            split[ticker] = ticker_frame if ticker_frame is not None and not ticker_frame.empty else None
+        return split
+
+    async def download_historical_data_async(self, tickers, period="1d", max_retries=5, base_delay=1, jitter=0.1):
+        """Downloads historical data for a list of tickers concurrently.
+
+        Requests go through the same scheduler as the blocking methods, and we
+        await them without blocking the event loop. Each ticker retries on its
+        own schedule, so one failing symbol does not hold up the others. With
+        chunk_size set the batched download runs on a worker thread instead.
+        """
+        if self.chunk_size:
+            return await asyncio.to_thread(self.download_batched_data, tickers, period, max_retries, base_delay,
+                                           jitter)
+        tickers = list(set(tickers))
+        frames = await asyncio.gather(*[
+            asyncio.wrap_future(self._submit_history(ticker, {"period": period}, max_retries, base_delay, jitter))
+            for ticker in tickers
+        ])
+        return dict(zip(tickers, frames))
 
     def get_latest_price(self, ticker):
         """Gets the latest price for a single ticker."""
         # return yf.Ticker(ticker).history(period="1d")["Close"].iloc[-1]
-        return exponential_backoff(5, 1, 0.1, self._get_latest_price, ticker)
+        return self.scheduler.submit(self.request_key("quote", ticker), partial(self._get_latest_price, ticker)).result()
+
+    def fetch_latest_prices(self, tickers):
+        """Fetch the last close of every ticker with one multi-symbol request.
+
+        When chunk_size is set the tickers are split into that many per
+        request, sent concurrently.
+        """
+        tickers = sorted(set(tickers))
+        chunk_size = self.chunk_size or len(tickers) or 1
+        submitted = []
+        for start in range(0, len(tickers), chunk_size):
+            chunk = tickers[start:start + chunk_size]
+            call = partial(self.downloader, chunk, period="1d", auto_adjust=True, group_by="ticker", progress=False)
+            submitted.append((chunk, self.scheduler.submit(self.request_key("quotes", tuple(chunk)), call)))
+
+        prices = {}
+        for chunk, future in submitted:
+            for ticker, frame in self._split_batch(future.result(), chunk).items():
+                close = frame["Close"].dropna() if frame is not None else None
+                prices[ticker] = float(close.iloc[-1]) if close is not None and not close.empty else None
+        return prices
 
     def _get_latest_price(self, ticker):
-        return yf.Ticker(ticker).history(period="1d")["Close"].iloc[-1]
+        return _yfinance().Ticker(ticker).history(period="1d")["Close"].iloc[-1]
 
 
 class YahooNode(Node):
-    def __init__(self, period: str = "1d"):
+    io_bound = True
+    # How long a NodeCache keeps a download when no refresh_interval is given.
+    default_cache_ttl = 60.0
+
+    def __init__(self, period: str = "1d", refresh_interval: float = None, chunk_size: int = None):
         super().__init__(None, pd.DataFrame)
         self.period = period
+        self.refresh_interval = refresh_interval
+        self.chunk_size = chunk_size
+
+    @property
+    def cache_ttl(self):
+        """Cached prices go stale after refresh_interval seconds, or default_cache_ttl without one."""
+        return self.refresh_interval if self.refresh_interval is not None else self.default_cache_ttl
+
+    def cache_params(self) -> dict:
+        """Include the current refresh window so each one gets its own cache entry."""
+        params = super().cache_params()
+        if self.refresh_interval is not None:
+            params["refresh"] = int(time.time() // self.refresh_interval)
+        return params
+
+    def fingerprint(self):
+        """Change once per refresh_interval seconds; without one, always re-download."""
+        if self.refresh_interval is None:
+            return None
+        return self.period, int(time.time() // self.refresh_interval)
 
     def process(self, _input: List[str]) -> dict[any, any]:
         """Download historical data for a list of tickers."""
-        return Yahoo().download_historical_data(_input, self.period)
+        return Yahoo(chunk_size=self.chunk_size).download_historical_data(_input, self.period)
+
+
+class AsyncYahooNode(YahooNode):
+    async def process(self, _input: List[str]) -> dict[any, any]:
+        """Download historical data for a list of tickers without blocking the event loop."""
+        return await Yahoo(chunk_size=self.chunk_size).download_historical_data_async(_input, self.period)
 
 
 class YahooProcessor(Node):
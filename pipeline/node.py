@@ -9,6 +9,25 @@ V = TypeVar('V')
 class Node(ABC, Generic[T, V]):
     """A node in a data processing pipeline2."""
 
+    # Nodes that mostly wait on disk or the network set this so a parallel
+    # PipelineRunner schedules them on its thread pool rather than its
+    # process pool.
+    io_bound = False
+
+    # Whether a PipelineRunner with a cache may reuse this node's results, and
+    # how many seconds a cached result stays valid (None uses the cache default).
+    # Nodes with side effects, like printing, should set cacheable to False.
+    cacheable = True
+    cache_ttl = None
+
+    # In PipelineRunner.run_streaming a reducer folds every batch it receives
+    # with initial/accumulate/finalize and emits a single result; any other
+    # node maps each batch through process_batch.
+    is_reducer = False
+
+    # Attributes set by Node.__init__ that do not affect what process returns.
+    _base_attrs = ("input_type", "output_type", "is_output", "uuid", "visited")
+
     # init method should take input and output types as arguments
     def __init__(self, input_type: T, output_type: V, is_output=False) -> None:
         self.input_type = input_type
@@ -25,6 +44,62 @@ class Node(ABC, Generic[T, V]):
         """Return the class name as well as a UUID."""
         return f"{self.__class__.__name__}-{self.uuid}"
 
+    def cache_params(self) -> dict:
+        """Return the parameters that determine this node's output.
+
+        Defaults to the attributes a subclass sets in its __init__. Nodes that
+        read external state (files, the network) should add something that
+        changes with it, like a file's mtime.
+        """
+        return {key: value for key, value in vars(self).items() if key not in self._base_attrs}
+
+    def fingerprint(self):
+        """Return a cheap summary of everything that can change this node's output.
+
+        An incremental PipelineRunner re-runs a node only when its fingerprint
+        differs from the previous run or one of its parents re-ran. The
+        default covers the node's parameters; returning None marks the node
+        as volatile, so it re-runs on every pass.
+        """
+        return repr(sorted(self.cache_params().items()))
+
+    def accepts(self, output_type) -> bool:
+        """Check whether this node can consume a value of output_type.
+
+        A join node with several parents may declare a tuple of input types;
+        it then receives a tuple of its parents' outputs in connection order.
+        """
+        if isinstance(self.input_type, tuple):
+            return output_type in self.input_type
+        return output_type == self.input_type
+
     @abstractmethod
     def process(self, _input: T) -> V:
         pass
+
+    def iter_batches(self, _input: T):
+        """Yield the output of a head node in batches for streaming runs.
+
+        The default yields the whole output of process as a single batch;
+        sources that can read incrementally, like CsvPortfolio, override it.
+        """
+        yield self.process(_input)
+
+    def process_batch(self, batch: T) -> V:
+        """Process one batch in a streaming run; returning None drops it.
+
+        Defaults to process, which is right for row-wise nodes.
+        """
+        return self.process(batch)
+
+    def initial(self):
+        """Return the starting state of a reducer."""
+        return None
+
+    def accumulate(self, state, batch: T):
+        """Fold one batch into a reducer's state and return the new state."""
+        raise NotImplementedError(f"{self.__class__.__name__} is a reducer but does not implement accumulate.")
+
+    def finalize(self, state) -> V:
+        """Turn a reducer's state into its output once every batch is in."""
+        return state
@@ -1,20 +1,115 @@
-from typing import List
+import queue
+import threading
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from functools import partial
+from typing import Callable, List, Optional, Union
 
 from multimethod import multimethod
 
+from cache import NodeCache, digest
 from graph import Graph
 from node import Node
+from plan import ExecutionPlan, run_chain
+from transport import SharedMemoryTransport, SharedPayload
+
+EXECUTORS = (None, "threads", "processes")
+
+# Put on a streaming edge after a node's last batch.
+_END = object()
+
+
+class _Cancelled(Exception):
+    """Raised inside a streaming worker when another node has failed."""
 
 
 class PipelineRunner:
     """Handles the data processing pipeline2.
 
     We add nodes and connection information to the app before we exec app.run().
+
+    By default nodes run one after another on the calling thread. Pass
+    executor="threads" or executor="processes" to dispatch every node as soon
+    as all of its parents have finished. In "processes" mode only CPU-bound
+    nodes go to the process pool; nodes with io_bound set still run on a
+    thread pool, since they spend their time waiting rather than computing.
+
+    Pass a NodeCache to reuse results of nodes whose parameters and upstream
+    inputs have not changed since an earlier run; per-node hits and misses are
+    kept in cache.stats.
+
+    run_streaming passes record batches along the edges instead of whole
+    objects; see its docstring.
+
+    With incremental=True the runner keeps each node's output between runs
+    and only re-runs nodes whose Node.fingerprint changed, plus everything
+    downstream of them. Reused nodes do not append to outputs again.
+
+    Pass a profiling.Profiler to record time, memory, sizes, cache hits and
+    retries of every node execution.
+
+    The graph is compiled into an ExecutionPlan on the first run and reused
+    until the graph changes; see compile.
+
+    Each intermediate output is dropped as soon as the last of its children
+    has run, so a run only holds the outputs still waiting for a consumer.
+    Incremental runners keep every output instead, since the next run may
+    reuse it. What outputs keeps of the output nodes is set by retain:
+    "all" appends every run's output, "latest" keeps only the last, an int N
+    keeps the last N, and a callable sink(node_id, output) receives each
+    output and nothing is kept.
+
+    With executor="processes", pass a transport.SharedMemoryTransport to move
+    large outputs between worker processes through shared memory instead of
+    pickling them through the pool's pipes.
     """
-    def __init__(self):
+    def __init__(self, executor: Optional[str] = None, max_workers: Optional[int] = None,
+                 cache: Optional[NodeCache] = None, incremental: bool = False, profiler=None,
+                 retain: Union[str, int, Callable] = "all", transport: Optional[SharedMemoryTransport] = None):
+        if executor not in EXECUTORS:
+            raise ValueError(f"Unknown executor {executor!r}, expected one of {EXECUTORS}.")
+        if not (retain in ("all", "latest") or callable(retain)
+                or (isinstance(retain, int) and not isinstance(retain, bool) and retain > 0)):
+            raise ValueError(f"Unknown retain {retain!r}, expected 'all', 'latest', a positive int or a callable.")
+
         self.graph = Graph()
         self.nodes = {}
         self.outputs = {}
+        self.executor = executor
+        self.max_workers = max_workers
+        self.cache = cache
+        self.incremental = incremental
+        self.profiler = profiler
+        self.retain = retain
+        self.transport = transport
+        self._fingerprints = {}
+        self._last_results = {}
+        self._last_digests = {}
+        self._thread_pool = None
+        self._process_pool = None
+        self._plan = None
+
+    @classmethod
+    def from_plan(cls, plan: ExecutionPlan, **kwargs) -> "PipelineRunner":
+        """Make a runner for a compiled plan, e.g. one loaded with ExecutionPlan.load.
+
+        The graph is restored from the plan without repeating the type and
+        cycle checks of connect_source. kwargs go to the constructor.
+        """
+        runner = cls(**kwargs)
+        runner.graph = Graph.restore(plan.nodes, ((plan.nodes[parent], node)
+                                                  for node, parents in zip(plan.nodes, plan.parents)
+                                                  for parent in parents))
+        runner.nodes = {node.id: node for node in plan.nodes}
+        plan.graph_version = runner.graph.version
+        runner._plan = plan
+        return runner
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.shutdown()
 
     def register_node(self, node: Node):
         self.nodes[node.id] = node
@@ -26,43 +121,465 @@ class PipelineRunner:
 
     def connect_source(self, source: Node, destination: Node):
         # print(source, destination)
-        if source.output_type != destination.input_type:
+        if not destination.accepts(source.output_type):
             raise ValueError(f"For {source} and {destination}\n\tOutput type {source.output_type} does not match input"
                              f" type {destination.input_type}.")
         self.graph.connect(source, destination)
 
+    def connect_edges(self, edges):
+        """Connect many (source, destination) pairs, checking for cycles once.
+
+        Much faster than connect_source in a loop when building large graphs
+        programmatically; see Graph.add_edges.
+        """
+        self.graph.add_edges(edges)
+
     @multimethod
     def connect_sources(self, sources: List, destination: Node):
         for source in sources:
             self.connect_source(source, destination)
 
+    def compile(self, fuse: bool = True) -> ExecutionPlan:
+        """Freeze the graph into an ExecutionPlan, or return the current one.
+
+        The plan is rebuilt only when the graph has changed since it was
+        compiled, so repeated runs of the same graph skip the topological
+        sort and graph lookups. With fuse, parallel runs submit each linear
+        chain of nodes as a single task.
+        """
+        if self._plan is None or self._plan.graph_version != self.graph.version:
+            self._plan = ExecutionPlan.from_graph(self.graph, fuse)
+        return self._plan
+
     def run(self):
         """Run the data processing pipeline2.
 
+        Nodes are executed once each, in topological order. A head node
+        receives None, a node with a single parent receives that parent's
+        output, and a join node receives a tuple of its parents' outputs in
+        the order they were connected.
+
         We return here on the off chance someone is using a 'pure' or mixed
         pipeline2.
         """
-        for head in self.graph.heads:
-            self._run_helper(head)
+        plan = self.compile()
+        if self.executor is None and self._plain():
+            # Nothing to look up or measure per node: run straight off the plan.
+            plan.execute(self._record_output, release=True)
+            return self.outputs
+
+        order = list(plan.nodes)
+        dirty, fingerprints = self._find_dirty(order)
+        results = {}
+        digests = {}
+
+        if self.executor is not None:
+            self._run_parallel(order, dirty, results, digests)
+        else:
+            self._run_serial(order, dirty, results, digests)
+
+        self._remember_run(fingerprints, results, digests)
+        return self.outputs
+
+    def run_streaming(self, queue_size: int = 4):
+        """Run the pipeline2 with every edge carrying a stream of batches.
+
+        Head nodes produce batches with Node.iter_batches, every other node
+        runs on its own thread and maps each incoming batch through
+        Node.process_batch, except reducers (Node.is_reducer), which fold all
+        of their batches into one output. Edges are queues holding at most
+        queue_size batches, so a fast producer blocks until its consumers
+        catch up and memory stays bounded by the batch size rather than the
+        input size.
+
+        Output nodes record every batch they emit, so long streams should end
+        in a reducer. Streaming runs do not use the cache or incremental
+        state, and join nodes are not supported, since their parents' streams
+        would have to be aligned batch by batch.
+        """
+        order = list(self.compile().nodes)
+        for node in order:
+            if len(self.graph.parents[node]) > 1:
+                raise ValueError(f"{node} has several parents; streaming runs do not support join nodes.")
+
+        inboxes = {node: queue.Queue(maxsize=queue_size) for node in order if self.graph.parents[node]}
+        stop = threading.Event()
+        errors = []
+        threads = [threading.Thread(target=self._stream_node,
+                                    args=(node, inboxes.get(node),
+                                          [inboxes[child] for child in self.graph.nodes[node]], stop, errors),
+                                    name=f"stream-{node.id}", daemon=True)
+                   for node in order]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
 
+        if errors:
+            raise errors[0]
         return self.outputs
 
-    def _run_helper(self, node: Node, _input=None):
-        """Recursive helper function for run."""
-        if node is None:
+    def shutdown(self):
+        """Shut down any worker pools started by a parallel run."""
+        for pool in (self._thread_pool, self._process_pool):
+            if pool is not None:
+                pool.shutdown()
+        self._thread_pool = None
+        self._process_pool = None
+
+    def _run_serial(self, order: List[Node], dirty: set, results: dict, digests: dict):
+        """Exec the nodes one after another on the calling thread."""
+        remaining = self._consumers(order)
+        for node in order:
+            if node not in dirty:
+                results[node] = self._reuse(node, digests)
+                continue
+
+            key, hit, current_output = self._cache_lookup(node, digests)
+            if not hit:
+                current_output = self._process(node, self._gather_input(node, results))
+                self._cache_store(node, key, current_output, digests)
+
+            self._release(node, results, remaining)
+            self._keep(node, current_output, results, remaining)
+            self._record_output(node, current_output)
+
+    def _run_parallel(self, order: List[Node], dirty: set, results: dict, digests: dict):
+        """Dispatch each node to a pool as soon as its parents have finished.
+
+        Every node carries a counter of unfinished parents; when a node
+        completes we decrement its children's counters and submit the ones
+        that reach zero, so independent branches overlap.
+        """
+        plan = self.compile()
+        # Fused chains only when nothing has to happen between their nodes.
+        chains = {}
+        if self._plain():
+            chains = {plan.nodes[chain[0]]: tuple(plan.nodes[i] for i in chain)
+                      for chain in plan.chains if len(chain) > 1}
+
+        pending = {node: len(self.graph.parents[node]) for node in order}
+        remaining = self._consumers(order)
+        futures = {}
+        # Shared payloads a running task is reading, unlinked once it is done.
+        holds = {}
+        # Reused and cached nodes finish without visiting a pool.
+        ready = deque()
+
+        def submit(node: Node):
+            future = None
+            if node in chains:
+                chain = chains[node]
+                if self._remote(node):
+                    future = self._pool_for(node).submit(self.transport.call, run_chain, chain,
+                                                         self._gather_input(node, results), result="list")
+                else:
+                    future = self._pool_for(node).submit(run_chain, chain,
+                                                         self._local(self._gather_input(node, results)))
+                futures[future] = (chain, None)
+            elif node not in dirty:
+                ready.append((node, self._reuse(node, digests), False))
+            else:
+                key, hit, current_output = self._cache_lookup(node, digests)
+                if hit:
+                    ready.append((node, current_output, True))
+                else:
+                    future = self._submit(node, self._gather_input(node, results))
+                    futures[future] = (node, key)
+            # The pending task holds its own reference to the input.
+            dropped = [value for value in self._release(node, results, remaining) if isinstance(value, SharedPayload)]
+            if future is not None:
+                holds[future] = dropped
+            else:
+                self._discard(dropped)
+
+        def finish(node: Node, current_output, fresh: bool = True):
+            payload = current_output
+            if self.incremental:
+                # The next run may reuse this output after its file is gone.
+                current_output = self._local(current_output)
+            self._keep(node, current_output, results, remaining)
+            if fresh:
+                self._record_output(node, self._local(current_output))
+            if isinstance(payload, SharedPayload) and results.get(node) is not payload:
+                self._discard([payload])
+
+            for child in self.graph.nodes[node]:
+                pending[child] -= 1
+                if pending[child] == 0:
+                    submit(child)
+
+        for node in order:
+            if pending[node] == 0:
+                submit(node)
+
+        try:
+            while ready or futures:
+                while ready:
+                    finish(*ready.popleft())
+                if not futures:
+                    break
+
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    node, key = futures.pop(future)
+                    self._discard(holds.pop(future, []))
+                    if isinstance(node, tuple):
+                        # A fused chain; its inner nodes have no other children.
+                        chain_outputs = future.result()
+                        for inner, inner_output in zip(node[:-1], chain_outputs):
+                            self._record_output(inner, self._local(inner_output))
+                            self._discard([inner_output])
+                        finish(node[-1], chain_outputs[-1])
+                        continue
+                    current_output = self._unwrap(future.result())
+                    if self.cache is not None:
+                        self._cache_store(node, key, self._local(current_output), digests)
+                    finish(node, current_output)
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
+        finally:
+            if self.transport is not None:
+                # Whatever a failed run left behind. Tasks still running clean up after themselves
+                # when they finish, so the run does not wait for them.
+                for future in futures:
+                    future.add_done_callback(partial(self._discard_task, holds.pop(future, [])))
+                self._discard([value for dropped in holds.values() for value in dropped])
+                self._discard(list(results.values()))
+
+    def _stream_node(self, node: Node, inbox: Optional[queue.Queue], outboxes: List[queue.Queue],
+                     stop: threading.Event, errors: list):
+        """Worker for one node of a streaming run."""
+        try:
+            if inbox is None:
+                outputs = node.iter_batches(None)
+            elif node.is_reducer:
+                state = node.initial()
+                for batch in self._drain(inbox, stop):
+                    state = node.accumulate(state, batch)
+                outputs = [node.finalize(state)]
+            else:
+                outputs = (node.process_batch(batch) for batch in self._drain(inbox, stop))
+
+            for current_output in outputs:
+                if current_output is None:
+                    continue
+                self._record_output(node, current_output)
+                for outbox in outboxes:
+                    self._put(outbox, current_output, stop)
+            for outbox in outboxes:
+                self._put(outbox, _END, stop)
+        except _Cancelled:
+            pass
+        except BaseException as exc:
+            errors.append(exc)
+            # Wake every other worker so the run fails instead of hanging.
+            stop.set()
+
+    @staticmethod
+    def _drain(inbox: queue.Queue, stop: threading.Event):
+        """Yield batches from inbox until the parent finishes."""
+        while True:
+            try:
+                batch = inbox.get(timeout=0.1)
+            except queue.Empty:
+                if stop.is_set():
+                    raise _Cancelled()
+                continue
+            if batch is _END:
+                return
+            yield batch
+
+    @staticmethod
+    def _put(outbox: queue.Queue, batch, stop: threading.Event):
+        """Block until outbox has room for batch, giving up if the run failed."""
+        while True:
+            try:
+                outbox.put(batch, timeout=0.1)
+                return
+            except queue.Full:
+                if stop.is_set():
+                    raise _Cancelled()
+
+    def _consumers(self, order: List[Node]) -> Optional[dict]:
+        """Count the children still to consume each node's output, or None to keep every output."""
+        if self.incremental:
+            return None
+        return {node: len(self.graph.nodes[node]) for node in order}
+
+    def _release(self, node: Node, results: dict, remaining: Optional[dict]) -> list:
+        """Note that node has taken its inputs, dropping parents it was the last consumer of.
+
+        Returns the outputs dropped.
+        """
+        dropped = []
+        if remaining is None:
+            return dropped
+        for parent in self.graph.parents[node]:
+            remaining[parent] -= 1
+            if remaining[parent] == 0 and parent in results:
+                dropped.append(results.pop(parent))
+        return dropped
+
+    def _keep(self, node: Node, current_output, results: dict, remaining: Optional[dict]):
+        """Store node's output for its children, unless nobody will read it."""
+        if remaining is None or remaining[node]:
+            results[node] = current_output
+
+    def _plain(self) -> bool:
+        """Whether runs need no per-node cache, incremental or profiling work."""
+        return self.cache is None and not self.incremental and self.profiler is None
+
+    def _process(self, node: Node, _input):
+        """Run node.process on the calling thread, profiling it if asked."""
+        if self.profiler is None:
+            return node.process(_input)
+        return self._unwrap(self.profiler.call(node, _input))
+
+    def _submit(self, node: Node, _input):
+        """Submit node.process to its pool, profiling it if asked."""
+        pool = self._pool_for(node)
+        if self._remote(node):
+            if self.profiler is None:
+                return pool.submit(self.transport.call, node.process, _input)
+            return pool.submit(self.transport.call, self.profiler.call, node, _input, result="profiled")
+
+        _input = self._local(_input)
+        if self.profiler is None:
+            return pool.submit(node.process, _input)
+        return pool.submit(self.profiler.call, node, _input)
+
+    def _remote(self, node: Node) -> bool:
+        """Whether node's input and output go through the transport."""
+        return self.transport is not None and self.executor == "processes" and not node.io_bound
+
+    def _local(self, value):
+        """Turn shared payloads back into values for use in this process."""
+        if self.transport is None:
+            return value
+        return self.transport.unpack(value)
+
+    def _discard(self, values):
+        if self.transport is not None:
+            for value in values:
+                self.transport.discard(value)
+
+    def _discard_task(self, inputs, future):
+        """Done-callback: discard a task's shared inputs and whatever it returned."""
+        self._discard(inputs)
+        if future.cancelled() or future.exception() is not None:
+            return
+        returned = future.result()
+        self._discard(returned if isinstance(returned, (list, tuple))
+                      and not isinstance(returned, SharedPayload) else [returned])
+
+    def _unwrap(self, result):
+        """Keep the profile record of a profiled call and return its output."""
+        if self.profiler is None:
+            return result
+        current_output, record = result
+        self.profiler.add(record)
+        return current_output
+
+    def _pool_for(self, node: Node):
+        """Pick the pool a node should run on, starting it if necessary."""
+        if self.executor == "processes" and not node.io_bound:
+            if self._process_pool is None:
+                self._process_pool = ProcessPoolExecutor(max_workers=self.max_workers)
+            return self._process_pool
+
+        if self._thread_pool is None:
+            self._thread_pool = ThreadPoolExecutor(max_workers=self.max_workers)
+        return self._thread_pool
+
+    def _find_dirty(self, order: List[Node]):
+        """Work out which nodes must run, returning (dirty nodes, new fingerprints).
+
+        Without incremental mode every node is dirty. Otherwise a node is
+        dirty if it has no previous output, its fingerprint is None or has
+        changed, or any of its parents is dirty. The fingerprints are only
+        kept once the run succeeds, so a failed run is retried in full.
+        """
+        if not self.incremental:
+            return set(order), {}
+
+        dirty = set()
+        fingerprints = {}
+        for node in order:
+            fingerprint = node.fingerprint()
+            fingerprints[node] = fingerprint
+            if (fingerprint is None
+                    or node not in self._last_results
+                    or self._fingerprints.get(node) != fingerprint
+                    or any(parent in dirty for parent in self.graph.parents[node])):
+                dirty.add(node)
+        return dirty, fingerprints
+
+    def _reuse(self, node: Node, digests: dict):
+        """Return the previous run's output of a clean node."""
+        if node in self._last_digests:
+            digests[node] = self._last_digests[node]
+        return self._last_results[node]
+
+    def _remember_run(self, fingerprints: dict, results: dict, digests: dict):
+        """Keep what an incremental run needs to skip clean nodes next time."""
+        if not self.incremental:
+            return
+        self._fingerprints = fingerprints
+        self._last_results = results
+        self._last_digests = digests
+
+    def _cache_lookup(self, node: Node, digests: dict):
+        """Look node up in the cache, returning (key, hit, output).
+
+        The key is None when the node cannot be cached on this run, either
+        because there is no cache, the node opted out, or a parent's output
+        has no digest.
+        """
+        if self.cache is None or not node.cacheable:
+            return None, False, None
+
+        parent_digests = tuple(digests.get(parent) for parent in self.graph.parents[node])
+        if None in parent_digests:
+            return None, False, None
+
+        key = self.cache.key(node, digest(parent_digests))
+        hit, output_digest, current_output = self.cache.get(node, key)
+        if hit:
+            digests[node] = output_digest
+            if self.profiler is not None:
+                self.profiler.cache_hit(node, current_output)
+        return key, hit, current_output
+
+    def _cache_store(self, node: Node, key: Optional[str], current_output, digests: dict):
+        """Save a freshly computed output and remember its digest for the children."""
+        if self.cache is None:
             return
+        if key is not None:
+            digests[node] = self.cache.put(node, key, current_output)
+        elif self.graph.nodes[node]:
+            digests[node] = digest(current_output)
 
-        # Exec this node.
-        current_output = node.process(_input)
+    def _gather_input(self, node: Node, results: dict):
+        """Collect the input for node from the outputs of its parents."""
+        parents = self.graph.parents[node]
+        if not parents:
+            return None
+        if len(parents) == 1:
+            return results[parents[0]]
+        return tuple(results[parent] for parent in parents)
 
-        # Check if this node is an output.
+    def _record_output(self, node: Node, current_output):
+        """Keep the output of node, as retain says, if it is marked as an output."""
         if node.is_output:
-            if node.id not in self.outputs:
-                self.outputs[node.id] = []
-            self.outputs[node.id].append(current_output)
-            # Output is not necessarily terminal, so we don't return here.
-
-        # Now pass its output to its children.
-        for next_node in self.graph.nodes[node]:
-            # ...and pass it to the next node
-            self._run_helper(next_node, current_output)
+            if callable(self.retain):
+                self.retain(node.id, current_output)
+            elif self.retain == "latest":
+                self.outputs[node.id] = [current_output]
+            else:
+                if node.id not in self.outputs:
+                    self.outputs[node.id] = [] if self.retain == "all" else deque(maxlen=self.retain)
+                self.outputs[node.id].append(current_output)
+            # Output is not necessarily terminal, so its children still run.
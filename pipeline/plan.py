@@ -0,0 +1,127 @@
+"""plan.py - A graph frozen into a reusable execution plan.
+
+PipelineRunner.compile turns its graph into an ExecutionPlan once: the
+topological order as a tuple, every node's parents as indices into it, and
+the linear chains that can run as one call. Running the plan fills a
+preallocated list of output slots instead of walking the graph's dicts, and
+a plan can be pickled to disk so a service can start from it without
+rebuilding and re-validating the graph.
+"""
+import pickle
+from typing import List, Tuple
+
+
+def run_chain(nodes, _input):
+    """Run a fused chain of nodes back to back, returning one entry per node.
+
+    Only the last node's output and those of output nodes are returned; the
+    other entries are None so intermediates die as soon as the next node is
+    done with them. Module level so a process pool can pickle it.
+    """
+    outputs = []
+    for i, node in enumerate(nodes):
+        _input = node.process(_input)
+        outputs.append(_input if node.is_output or i == len(nodes) - 1 else None)
+    return outputs
+
+
+class ExecutionPlan:
+    """Immutable schedule of a graph's nodes.
+
+    Attributes:
+        nodes: The nodes in topological order.
+        parents: For each node, the indices of its parents in connection order.
+        children: For each node, the indices of its children.
+        chains: The order split into runs of nodes where each passes its
+            output to exactly one node that has no other parent. A parallel
+            runner submits each chain as a single task.
+        graph_version: Graph.version the plan was compiled from.
+    """
+
+    def __init__(self, nodes: Tuple, parents: Tuple[Tuple[int, ...], ...], children: Tuple[Tuple[int, ...], ...],
+                 chains: Tuple[Tuple[int, ...], ...], graph_version: int = 0):
+        self.nodes = nodes
+        self.parents = parents
+        self.children = children
+        self.chains = chains
+        self.graph_version = graph_version
+        self.index = {node: i for i, node in enumerate(nodes)}
+
+    @classmethod
+    def from_graph(cls, graph, fuse: bool = True) -> "ExecutionPlan":
+        """Compile graph; raises ValueError if it contains a cycle."""
+        order = graph.topological_sort()
+        index = {node: i for i, node in enumerate(order)}
+        parents = tuple(tuple(index[parent] for parent in graph.parents[node]) for node in order)
+        children = tuple(tuple(index[child] for child in graph.nodes[node]) for node in order)
+        return cls(tuple(order), parents, children, cls._find_chains(order, parents, children, fuse),
+                   graph.version)
+
+    @staticmethod
+    def _find_chains(order, parents, children, fuse):
+        chains = []
+        seen = set()
+        for i in range(len(order)):
+            if i in seen:
+                continue
+            chain = [i]
+            # Only fuse nodes bound for the same kind of pool.
+            while (fuse and len(children[chain[-1]]) == 1 and len(parents[children[chain[-1]][0]]) == 1
+                   and order[children[chain[-1]][0]].io_bound == order[i].io_bound):
+                chain.append(children[chain[-1]][0])
+            seen.update(chain)
+            chains.append(tuple(chain))
+        return tuple(chains)
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def __getstate__(self):
+        return {"nodes": self.nodes, "parents": self.parents, "children": self.children, "chains": self.chains,
+                "graph_version": self.graph_version}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def gather_input(self, i: int, slots: List):
+        """Build the input of node i from the output slots of its parents."""
+        parents = self.parents[i]
+        if not parents:
+            return None
+        if len(parents) == 1:
+            return slots[parents[0]]
+        return tuple(slots[parent] for parent in parents)
+
+    def execute(self, record=None, release: bool = True) -> List:
+        """Run every node in order on the calling thread and return the output slots.
+
+        record(node, output) is called for each node marked is_output. With
+        release, each slot is cleared as soon as the last of its node's
+        children has run, so only outputs still waiting for a consumer stay
+        alive and the returned slots are mostly None.
+        """
+        slots = [None] * len(self.nodes)
+        remaining = [len(children) for children in self.children]
+        for i, node in enumerate(self.nodes):
+            current_output = node.process(self.gather_input(i, slots))
+            if release:
+                for parent in self.parents[i]:
+                    remaining[parent] -= 1
+                    if remaining[parent] == 0:
+                        slots[parent] = None
+            if record is not None and node.is_output:
+                record(node, current_output)
+            if not release or self.children[i]:
+                slots[i] = current_output
+            current_output = None
+        return slots
+
+    def save(self, path: str):
+        """Pickle the plan, nodes included, to path."""
+        with open(path, "wb") as f:
+            pickle.dump(self, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def load(path: str) -> "ExecutionPlan":
+        with open(path, "rb") as f:
+            return pickle.load(f)
@@ -4,31 +4,190 @@ The CSV file should have the following columns: Ticker,Date,Action,Quantity,Pric
 
 Any other columns are not necessary, but will be included in the output for user convenience. If you need to process
 those other columns, you can do so in a separate downstream node.
+
+A schema maps column names to how they should be read, so pandas does not
+have to infer every dtype. Besides any pandas dtype name ("category",
+"float32", ...) two special kinds are understood: "datetime" parses dates
+and "currency" strips "$", "," and accounting parentheses in one vectorized
+pass.
 """
+import json
+import os
+import pickle
+from typing import Dict, Iterator, List
+
 import pandas as pd
-from typing import Type, List
 
 from pipeline2.node import Node
 
+PORTFOLIO_SCHEMA = {
+    "Ticker": "category",
+    "Date": "datetime",
+    "Action": "category",
+    "Quantity": "float64",
+    "Price": "currency",
+}
+
+
+def clean_currency(values: pd.Series, dtype: str = "float64") -> pd.Series:
+    """Parse a column of amounts such as "$1,234.50" or "(12.00)" into floats."""
+    if pd.api.types.is_numeric_dtype(values):
+        return values.astype(dtype)
+
+    text = values.astype("string").str.strip()
+    negative = (text.str.startswith("(") & text.str.endswith(")")).fillna(False).to_numpy(dtype=bool)
+    cleaned = text.str.replace(r"[$,()\s]", "", regex=True).replace("", pd.NA)
+    numbers = pd.to_numeric(cleaned).astype(dtype)
+    return numbers.where(~negative, -numbers)
+
+
+def _has_pyarrow() -> bool:
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
 
 class CsvPortfolio(Node):
-    def __init__(self, file_path: str, col_check: List[str] = None):
+    """Read a portfolio CSV into a DataFrame indexed by Date.
+
+    Args:
+        file_path: The CSV to read.
+        col_check: Columns that must be present.
+        schema: Column name to dtype, "datetime" or "currency"; see
+            PORTFOLIO_SCHEMA. Columns not listed are inferred by pandas.
+        chunksize: Read this many rows at a time, converting each chunk to its
+            compact dtypes before the next is read, which keeps peak memory
+            near the size of the typed result.
+        sidecar: Keep a Parquet copy (a pickle if pyarrow is missing) next to
+            the CSV and load from it while the CSV's mtime and size are
+            unchanged.
+    """
+    io_bound = True
+
+    def __init__(self, file_path: str, col_check: List[str] = None, schema: Dict[str, str] = None,
+                 chunksize: int = None, sidecar: bool = False):
         super().__init__(None, pd.DataFrame)
         self.file_path = file_path
         self.col_check = col_check
+        self.schema = schema
+        self.chunksize = chunksize
+        self.sidecar = sidecar
+
+    def cache_params(self) -> dict:
+        """Include the file's mtime and size so edits invalidate cached results."""
+        stat = os.stat(self.file_path)
+        return {**super().cache_params(), "mtime": stat.st_mtime_ns, "size": stat.st_size}
 
     def process(self, _input: None) -> pd.DataFrame:
         """Read the CSV file and return a DataFrame."""
-        df = pd.read_csv(self.file_path)
+        df = self._read_sidecar() if self.sidecar else None
+        if df is None:
+            # Stamp the sidecar with the file as it was before reading, so rows
+            # appended meanwhile make it stale rather than hide behind it.
+            key = self._sidecar_key() if self.sidecar else None
+            df = self.read()
+            if self.sidecar:
+                self._write_sidecar(df, key)
+
+        # set data as index in the dataframe
+        # Do we actually need to do this??
+        df.set_index('Date', inplace=True)
+
+        return df
 
+    def iter_batches(self, _input: None) -> Iterator[pd.DataFrame]:
+        """Yield the portfolio in Date-indexed chunks for streaming runs."""
+        for chunk in self.iter_chunks():
+            yield chunk.set_index('Date')
+
+    def read(self) -> pd.DataFrame:
+        """Read and type the whole CSV, chunk by chunk if chunksize is set."""
+        if self.chunksize is None:
+            return self.parse(self.file_path)
+
+        df = pd.concat(self.iter_chunks(), ignore_index=True)
+        # Chunks with different category sets concatenate to object; restore them.
+        for column, kind in (self.schema or {}).items():
+            if kind == "category" and column in df.columns:
+                df[column] = df[column].astype("category")
+        return df
+
+    def parse(self, source) -> pd.DataFrame:
+        """Read and type CSV text from a path or file object with this portfolio's schema."""
+        return self._check_columns(self._apply_schema(pd.read_csv(source, **self._read_kwargs())))
+
+    def iter_chunks(self, chunksize: int = None) -> Iterator[pd.DataFrame]:
+        """Yield typed chunks of the CSV without holding the whole file in memory."""
+        reader = pd.read_csv(self.file_path, chunksize=chunksize or self.chunksize or 100_000,
+                             **self._read_kwargs())
+        with reader:
+            for chunk in reader:
+                yield self._check_columns(self._apply_schema(chunk))
+
+    def _read_kwargs(self) -> dict:
+        dtype = {}
+        parse_dates = []
+        for column, kind in (self.schema or {}).items():
+            if kind == "datetime":
+                parse_dates.append(column)
+            elif kind == "currency":
+                # Read as text and convert in one vectorized pass afterwards.
+                dtype[column] = "string"
+            else:
+                dtype[column] = kind
+        return {"dtype": dtype or None, "parse_dates": parse_dates or None}
+
+    def _apply_schema(self, df: pd.DataFrame) -> pd.DataFrame:
+        for column, kind in (self.schema or {}).items():
+            if kind == "currency" and column in df.columns:
+                df[column] = clean_currency(df[column])
+        return df
+
+    def _check_columns(self, df: pd.DataFrame) -> pd.DataFrame:
         # check if columns are in the dataframe
         if self.col_check is not None:
             cols_not_found = [col for col in self.col_check if col not in df.columns]
             if len(cols_not_found) > 0:
                 raise ValueError(f"Columns not found in portfolio {self.file_path}: {cols_not_found}")
+        return df
 
-        # set data as index in the dataframe
-        # Do we actually need to do this??
-        df.set_index('Date', inplace=True)
+    def _sidecar_paths(self):
+        ext = "parquet" if _has_pyarrow() else "pkl"
+        return f"{self.file_path}.{ext}", f"{self.file_path}.sidecar.json"
 
-        return df
+    def _sidecar_key(self) -> dict:
+        stat = os.stat(self.file_path)
+        return {"mtime": stat.st_mtime_ns, "size": stat.st_size, "schema": self.schema}
+
+    def _read_sidecar(self):
+        data_path, meta_path = self._sidecar_paths()
+        try:
+            with open(meta_path) as f:
+                if json.load(f) != self._sidecar_key():
+                    return None
+            if data_path.endswith(".parquet"):
+                df = pd.read_parquet(data_path)
+            else:
+                with open(data_path, "rb") as f:
+                    df = pickle.load(f)
+        except (OSError, ValueError):
+            return None
+        return self._check_columns(df)
+
+    def _write_sidecar(self, df: pd.DataFrame, key: dict):
+        data_path, meta_path = self._sidecar_paths()
+        try:
+            if data_path.endswith(".parquet"):
+                df.to_parquet(data_path, index=False)
+            else:
+                with open(data_path, "wb") as f:
+                    pickle.dump(df, f, protocol=pickle.HIGHEST_PROTOCOL)
+            with open(meta_path, "w") as f:
+                json.dump(key, f)
+        except (OSError, ValueError, TypeError, NotImplementedError):
+            # A read-only directory, or columns Parquet cannot store, just means
+            # no sidecar; the CSV still loaded. pyarrow's ArrowInvalid and
+            # ArrowTypeError derive from ValueError and TypeError.
+            pass
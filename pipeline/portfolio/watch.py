@@ -0,0 +1,171 @@
+"""portfolio/watch.py - Follow a portfolio CSV as transactions are appended to it.
+
+A PortfolioWatcher remembers the file's identity (device and inode), size and
+mtime, and how many bytes of it have been parsed. Each poll starts with a
+single stat: if nothing moved, that is all it costs. When the file has grown
+in place, only the bytes after the parsed offset are read and parsed, and
+just those rows are emitted. Anything else (a different inode because an
+editor replaced the file, a shorter file, a rewrite that kept the size, or
+bytes before the offset that no longer match) reloads the whole file.
+
+Earlier content is checked without reading all of it: the block just before
+the offset must be unchanged, and so must a digest of blocks sampled evenly
+across the parsed prefix, the header included. An edit that grows the file
+but touches none of those blocks goes unnoticed until the next reload.
+
+A row may still be half written when the file is polled, so an append
+only parses complete lines. A last line without a newline is taken as it
+stands by a full reload, or once a poll finds the file unchanged since the
+previous one. If more bytes later continue that line instead of starting
+with its newline, the row was incomplete after all and the file is
+reloaded.
+"""
+import hashlib
+import io
+import os
+from typing import Dict, List, NamedTuple
+
+import pandas as pd
+
+from pipeline2.node import Node
+from pipeline2.portfolio.csv import CsvPortfolio
+
+# Bytes just before the parsed offset that are re-read and compared on every
+# append, to notice earlier content that was edited while the file grew.
+ANCHOR_BYTES = 4096
+# Blocks of ANCHOR_BYTES spread over the parsed prefix that are digested to
+# notice edits further back.
+SAMPLE_BLOCKS = 8
+
+
+class PortfolioDelta(NamedTuple):
+    """What changed since the previous poll.
+
+    kind is "unchanged", "appended" (rows are only the new transactions) or
+    "reloaded" (rows are the whole portfolio and replace what came before).
+    """
+    kind: str
+    rows: pd.DataFrame
+
+
+class PortfolioWatcher(Node):
+    """Emit the transactions added to a portfolio CSV since the last run.
+
+    As a node, each run outputs the new rows indexed by Date, like
+    CsvPortfolio: the whole portfolio on the first run or after a reload,
+    then only appended rows, and an empty frame when nothing changed. Use
+    poll() directly to also learn whether the rows replace or extend the
+    portfolio.
+
+    Args:
+        file_path: The CSV to follow.
+        col_check: Columns that must be present.
+        schema: How to type the columns; see PORTFOLIO_SCHEMA.
+    """
+    io_bound = True
+    # Every run reports a different delta, so never reuse an earlier output.
+    cacheable = False
+
+    def __init__(self, file_path: str, col_check: List[str] = None, schema: Dict[str, str] = None):
+        super().__init__(None, pd.DataFrame)
+        self.file_path = file_path
+        self.reader = CsvPortfolio(file_path, col_check=col_check, schema=schema)
+        self.reset()
+
+    def reset(self):
+        """Forget what was read, so the next poll reloads the whole file."""
+        self._stat_key = None
+        self._offset = 0
+        self._header = b""
+        self._anchor = b""
+        self._partial = b""
+        self._digest = None
+        self._empty = None
+
+    def fingerprint(self):
+        return None
+
+    def process(self, _input: None) -> pd.DataFrame:
+        return self.poll().rows.set_index("Date")
+
+    def poll(self) -> PortfolioDelta:
+        stat = os.stat(self.file_path)
+        key = (stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns)
+        previous = self._stat_key
+        if key == previous:
+            if stat.st_size > self._offset + len(self._partial):
+                # The unterminated last line has not moved since the last poll; take it as written.
+                return self._take_partial(stat.st_size)
+            return PortfolioDelta("unchanged", self._empty)
+
+        if (previous is None or key[:2] != previous[:2] or stat.st_size < self._offset + len(self._partial)
+                or stat.st_size == previous[2]):
+            return self._reload(key)
+
+        with open(self.file_path, "rb") as f:
+            if self._prefix_digest(f, self._offset) != self._digest:
+                return self._reload(key)
+            f.seek(self._offset - len(self._anchor))
+            data = f.read()
+            if not data.startswith(self._anchor):
+                return self._reload(key)
+            data = data[len(self._anchor):]
+
+            if self._partial:
+                # The last line was already taken without its newline; it must have been complete.
+                if not data.startswith(self._partial + b"\n"):
+                    return self._reload(key)
+                self._advance(data[:len(self._partial) + 1])
+                data = data[len(self._partial) + 1:]
+                self._partial = b""
+
+            tail = data[:data.rfind(b"\n") + 1]
+            self._stat_key = key
+            self._advance(tail)
+            self._digest = self._prefix_digest(f, self._offset)
+        if not tail.strip():
+            return PortfolioDelta("unchanged", self._empty)
+        return PortfolioDelta("appended", self.reader.parse(io.BytesIO(self._header + tail)))
+
+    def _advance(self, consumed: bytes):
+        self._offset += len(consumed)
+        self._anchor = (self._anchor + consumed)[-ANCHOR_BYTES:]
+
+    def _take_partial(self, size: int) -> PortfolioDelta:
+        with open(self.file_path, "rb") as f:
+            f.seek(self._offset)
+            self._partial = f.read(size - self._offset)
+        if not self._partial.strip():
+            return PortfolioDelta("unchanged", self._empty)
+        return PortfolioDelta("appended", self.reader.parse(io.BytesIO(self._header + self._partial)))
+
+    def _reload(self, key) -> PortfolioDelta:
+        with open(self.file_path, "rb") as f:
+            data = f.read()
+            if not data.strip():
+                self.reset()
+                return PortfolioDelta("unchanged", pd.DataFrame({"Date": []}))
+
+            # A full reload takes the whole file, an unterminated last line included. The offset stays
+            # at the last newline and that line is remembered, so an append can tell whether it was
+            # complete.
+            df = self.reader.parse(io.BytesIO(data))
+            header_end = data.find(b"\n") + 1
+            self._header = data[:header_end] if header_end else data + b"\n"
+            self._offset = data.rfind(b"\n") + 1
+            self._partial = data[self._offset:]
+            self._anchor = data[max(header_end, self._offset - ANCHOR_BYTES):self._offset]
+            self._digest = self._prefix_digest(f, self._offset)
+        self._stat_key = key
+        self._empty = df.iloc[:0]
+        return PortfolioDelta("reloaded", df)
+
+    @staticmethod
+    def _prefix_digest(f, end: int) -> bytes:
+        """Digest of SAMPLE_BLOCKS blocks spread evenly over the first end bytes of f."""
+        h = hashlib.blake2b(digest_size=16)
+        for i in range(SAMPLE_BLOCKS):
+            start = end * i // SAMPLE_BLOCKS
+            f.seek(start)
+            h.update(f.read(min(ANCHOR_BYTES, end - start)))
+        return h.digest()
@@ -1,2 +1,391 @@
 """cost_basis.py - Given a backing DataFrame containing ticker, date, action, quantity, and price, update the DataFrame
-to include the cost basis of each ticker."""
+to include the cost basis of each ticker.
+
+Buys and sells are matched per ticker with one of three methods:
+
+    fifo     sells consume the oldest open lots first
+    lifo     sells consume the newest open lots first
+    average  sells are costed at the running average cost of the position
+
+Transactions are sorted once by (ticker, date) so each ticker is a contiguous
+run of rows; everything else is array arithmetic over those runs. A sell
+larger than the shares held only closes what is held, and the excess is
+reported as UnmatchedQuantity.
+"""
+from typing import NamedTuple, Optional
+
+import numpy as np
+import pandas as pd
+
+from pipeline2.node import Node
+from pipeline2.portfolio.csv import clean_currency
+
+METHODS = ("fifo", "lifo", "average")
+
+# Quantities closer than this are treated as equal, to absorb float error in
+# the running sums used to line buys up against sells.
+EPSILON = 1e-9
+
+NS_PER_DAY = 86_400 * 10 ** 9
+
+
+class CostBasisResult(NamedTuple):
+    """Output of match_lots.
+
+    lots holds one row per closed (buy, sell) match, or per sell for the
+    average method; open_lots holds what is still held; summary has one row
+    per ticker.
+    """
+    lots: pd.DataFrame
+    open_lots: pd.DataFrame
+    summary: pd.DataFrame
+
+
+class _Transactions(NamedTuple):
+    """Buy and sell rows sorted by (ticker, date), as flat arrays."""
+    tickers: np.ndarray
+    codes: np.ndarray
+    starts: np.ndarray
+    counts: np.ndarray
+    dates: np.ndarray
+    price: np.ndarray
+    is_buy: np.ndarray
+    buy_qty: np.ndarray
+    sell_qty: np.ndarray
+    unmatched: np.ndarray
+
+
+def _to_float(values: pd.Series) -> np.ndarray:
+    """Parse numbers that may be written as currency, e.g. "$1,234.50"."""
+    return clean_currency(values).to_numpy(dtype=float)
+
+
+def _group_cumsum(values: np.ndarray, starts: np.ndarray, counts: np.ndarray) -> np.ndarray:
+    """Running sum of values that restarts at every ticker."""
+    total = np.cumsum(values)
+    before = total[starts] - values[starts]
+    return total - np.repeat(before, counts)
+
+
+def _group_shift(values: np.ndarray, starts: np.ndarray) -> np.ndarray:
+    """The previous row's value within each ticker, 0 for a ticker's first row."""
+    shifted = np.empty_like(values)
+    shifted[1:] = values[:-1]
+    shifted[starts] = 0
+    return shifted
+
+
+def _prepare(df: pd.DataFrame) -> _Transactions:
+    if "Date" not in df.columns:
+        # CsvPortfolio indexes by Date.
+        df = df.reset_index()
+
+    action = df["Action"].astype(str).str.strip().str.lower()
+    is_buy = action.str.startswith("buy").to_numpy()
+    is_sell = action.str.startswith("sell").to_numpy()
+    df = df[is_buy | is_sell]
+    is_buy = is_buy[is_buy | is_sell]
+
+    codes, tickers = pd.factorize(df["Ticker"], sort=True)
+    dates = pd.to_datetime(df["Date"]).to_numpy(dtype="datetime64[ns]")
+    order = np.lexsort((dates, codes))
+
+    codes = codes[order]
+    dates = dates[order]
+    is_buy = is_buy[order]
+    quantity = np.abs(_to_float(df["Quantity"])[order])
+    price = _to_float(df["Price"])[order]
+
+    counts = np.bincount(codes, minlength=len(tickers))
+    starts = np.cumsum(counts) - counts
+
+    # Shares held after each row, never below zero: a running sum reflected
+    # at zero is the sum minus its running minimum (when that is negative).
+    signed = np.where(is_buy, quantity, -quantity)
+    running = _group_cumsum(signed, starts, counts)
+    running_min = pd.Series(running).groupby(codes).cummin().to_numpy()
+    held = running - np.minimum(running_min, 0)
+    held_before = _group_shift(held, starts)
+
+    sell_qty = np.where(is_buy, 0.0, held_before - held)
+    return _Transactions(
+        tickers=np.asarray(tickers), codes=codes, starts=starts, counts=counts, dates=dates, price=price,
+        is_buy=is_buy, buy_qty=np.where(is_buy, quantity, 0.0), sell_qty=sell_qty,
+        unmatched=np.where(is_buy, 0.0, quantity - sell_qty),
+    )
+
+
+def _lots_frame(tx, codes, buy_dates, sell_dates, quantity, buy_price, sell_price):
+    cost = quantity * buy_price
+    proceeds = quantity * sell_price
+    return pd.DataFrame({
+        "Ticker": tx.tickers[codes],
+        "BuyDate": buy_dates,
+        "SellDate": sell_dates,
+        "Quantity": quantity,
+        "Cost": cost,
+        "Proceeds": proceeds,
+        "RealizedPnL": proceeds - cost,
+        "HoldingDays": (sell_dates - buy_dates).astype(np.int64) / NS_PER_DAY,
+    })
+
+
+def _open_frame(tx, codes, buy_dates, quantity, cost):
+    return pd.DataFrame({"Ticker": tx.tickers[codes], "BuyDate": buy_dates, "Quantity": quantity, "Cost": cost})
+
+
+def _match_fifo(tx: _Transactions):
+    """Line every ticker's buys and sells up on one number line and intersect them.
+
+    Ticker k owns the range [offset_k, offset_k + shares bought). Buys tile it
+    in date order and sells tile its start in date order, so under FIFO the
+    shares a sell closes are exactly the buy ranges its own range overlaps.
+    Cutting the line at every range boundary gives segments that each
+    belong to one buy and at most one sell.
+    """
+    bought = np.add.reduceat(tx.buy_qty, tx.starts) if len(tx.codes) else np.zeros(0)
+    offsets = np.repeat(np.cumsum(bought) - bought, tx.counts)
+
+    buy_rows = np.flatnonzero(tx.buy_qty > EPSILON)
+    sell_rows = np.flatnonzero(tx.sell_qty > EPSILON)
+    if not len(buy_rows):
+        rows, values, dates = np.zeros(0, dtype=np.int64), np.zeros(0), tx.dates[:0]
+        return (_lots_frame(tx, rows, dates, dates, values, values, values),
+                _open_frame(tx, rows, dates, values, values))
+
+    buy_end = (_group_cumsum(tx.buy_qty, tx.starts, tx.counts) + offsets)[buy_rows]
+    buy_start = buy_end - tx.buy_qty[buy_rows]
+    sell_end = (_group_cumsum(tx.sell_qty, tx.starts, tx.counts) + offsets)[sell_rows]
+    sell_start = sell_end - tx.sell_qty[sell_rows]
+
+    points = np.unique(np.concatenate([buy_start, buy_end, sell_start, sell_end]))
+    seg_start = points[:-1]
+    seg_len = np.diff(points)
+
+    # The buy (and sell, if any) whose range contains each segment's start.
+    buy = np.minimum(np.searchsorted(buy_end, seg_start + EPSILON), len(buy_rows) - 1)
+    in_buy = (seg_len > EPSILON) & (buy_start[buy] <= seg_start + EPSILON)
+    if len(sell_rows):
+        sell = np.minimum(np.searchsorted(sell_end, seg_start + EPSILON), len(sell_rows) - 1)
+        in_sell = (sell_start[sell] <= seg_start + EPSILON) & (sell_end[sell] > seg_start + EPSILON)
+    else:
+        sell = np.zeros(len(seg_start), dtype=np.int64)
+        in_sell = np.zeros(len(seg_start), dtype=bool)
+
+    closed = in_buy & in_sell
+    b = buy_rows[buy[closed]]
+    s = sell_rows[sell[closed]]
+    lots = _lots_frame(tx, tx.codes[b], tx.dates[b], tx.dates[s], seg_len[closed], tx.price[b], tx.price[s])
+
+    still_open = in_buy & ~in_sell
+    o = buy_rows[buy[still_open]]
+    open_lots = _open_frame(tx, tx.codes[o], tx.dates[o], seg_len[still_open], seg_len[still_open] * tx.price[o])
+    return lots, open_lots
+
+
+def _match_lifo(tx: _Transactions):
+    """Close the newest open lot first.
+
+    LIFO depends on which lots survived every earlier sell, so unlike FIFO it
+    cannot be reduced to independent array operations; this is a single
+    pass with a stack per ticker over plain lists.
+    """
+    codes = tx.codes.tolist()
+    is_buy = tx.is_buy.tolist()
+    buy_qty = tx.buy_qty.tolist()
+    sell_qty = tx.sell_qty.tolist()
+
+    closed_buy, closed_sell, closed_qty = [], [], []
+    open_rows, open_qty = [], []
+    stack = []
+    for row, code in enumerate(codes):
+        if row == 0 or code != codes[row - 1]:
+            for lot_row, lot_qty in stack:
+                open_rows.append(lot_row)
+                open_qty.append(lot_qty)
+            stack = []
+
+        if is_buy[row]:
+            if buy_qty[row] > EPSILON:
+                stack.append([row, buy_qty[row]])
+            continue
+
+        remaining = sell_qty[row]
+        while remaining > EPSILON and stack:
+            lot = stack[-1]
+            taken = min(lot[1], remaining)
+            closed_buy.append(lot[0])
+            closed_sell.append(row)
+            closed_qty.append(taken)
+            remaining -= taken
+            lot[1] -= taken
+            if lot[1] <= EPSILON:
+                stack.pop()
+
+    for lot_row, lot_qty in stack:
+        open_rows.append(lot_row)
+        open_qty.append(lot_qty)
+
+    b = np.asarray(closed_buy, dtype=np.int64)
+    s = np.asarray(closed_sell, dtype=np.int64)
+    lots = _lots_frame(tx, tx.codes[b], tx.dates[b], tx.dates[s], np.asarray(closed_qty, dtype=float),
+                       tx.price[b], tx.price[s])
+    o = np.asarray(open_rows, dtype=np.int64)
+    quantity = np.asarray(open_qty, dtype=float)
+    open_lots = _open_frame(tx, tx.codes[o], tx.dates[o], quantity, quantity * tx.price[o])
+    return lots, open_lots
+
+
+def _match_average(tx: _Transactions):
+    """Cost every sell at the position's running average cost.
+
+    The cost held follows C_i = r_i * C_(i-1) + b_i, where a buy adds
+    b_i = quantity * price and a sell keeps the fraction r_i of shares left.
+    Within a run that never goes flat this solves in closed form as
+    C_i = R_i * cumsum(b_j / R_j), with R the running product of r, computed
+    in log space. Each time a position closes completely a new run starts,
+    which keeps R away from zero. The shares-weighted acquisition date follows
+    the same recurrence and gives the holding period.
+    """
+    held = _group_cumsum(tx.buy_qty - tx.sell_qty, tx.starts, tx.counts)
+    held_before = _group_shift(held, tx.starts)
+    flat = held <= EPSILON
+
+    # A run starts at each ticker's first row and after every row that went flat.
+    run_start = _group_shift(flat.astype(np.int64), tx.starts).astype(bool)
+    run_start[tx.starts] = True
+    run = np.cumsum(run_start) - 1
+    run_starts = np.flatnonzero(run_start)
+    run_counts = np.diff(np.append(run_starts, len(run)))
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        keep = np.where(tx.is_buy | flat, 1.0, held / held_before)
+    log_r = _group_cumsum(np.log(keep), run_starts, run_counts)
+    scale = np.exp(-log_r)
+
+    days = tx.dates.astype(np.int64) / NS_PER_DAY
+    cost = np.exp(log_r) * _group_cumsum(tx.buy_qty * tx.price * scale, run_starts, run_counts)
+    date_mass = np.exp(log_r) * _group_cumsum(tx.buy_qty * days * scale, run_starts, run_counts)
+    cost[flat] = 0.0
+    date_mass[flat] = 0.0
+
+    cost_before = _group_shift(cost, tx.starts)
+    date_before = _group_shift(date_mass, tx.starts)
+
+    s = np.flatnonzero(tx.sell_qty > EPSILON)
+    fraction = tx.sell_qty[s] / held_before[s]
+    removed = cost_before[s] * fraction
+    acquired = date_before[s] / held_before[s]
+    proceeds = tx.sell_qty[s] * tx.price[s]
+    lots = pd.DataFrame({
+        "Ticker": tx.tickers[tx.codes[s]],
+        "BuyDate": (acquired * NS_PER_DAY).astype("datetime64[ns]"),
+        "SellDate": tx.dates[s],
+        "Quantity": tx.sell_qty[s],
+        "Cost": removed,
+        "Proceeds": proceeds,
+        "RealizedPnL": proceeds - removed,
+        "HoldingDays": days[s] - acquired,
+    })
+
+    last = tx.starts + tx.counts - 1
+    o = last[held[last] > EPSILON] if len(last) else last
+    open_lots = _open_frame(tx, tx.codes[o], ((date_mass[o] / held[o]) * NS_PER_DAY).astype("datetime64[ns]"),
+                            held[o], cost[o])
+    return lots, open_lots
+
+
+def _summarize(tx, lots, open_lots, prices, as_of):
+    n = len(tx.tickers)
+    lot_codes = pd.Categorical(lots["Ticker"], categories=tx.tickers).codes
+    open_codes = pd.Categorical(open_lots["Ticker"], categories=tx.tickers).codes
+
+    def total(codes, weights):
+        return np.bincount(codes, weights=weights, minlength=n) if len(codes) else np.zeros(n)
+
+    sold = total(lot_codes, lots["Quantity"].to_numpy())
+    open_qty = total(open_codes, open_lots["Quantity"].to_numpy())
+    open_cost = total(open_codes, open_lots["Cost"].to_numpy())
+    open_age = (as_of - open_lots["BuyDate"]).dt.total_seconds().to_numpy() / 86_400
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        summary = pd.DataFrame({
+            "OpenQuantity": open_qty,
+            "OpenCost": open_cost,
+            "AverageCost": open_cost / open_qty,
+            "RealizedPnL": total(lot_codes, lots["RealizedPnL"].to_numpy()),
+            "SoldQuantity": sold,
+            "UnmatchedQuantity": np.add.reduceat(tx.unmatched, tx.starts) if n else np.zeros(0),
+            "AvgHoldingDays": total(lot_codes, (lots["Quantity"] * lots["HoldingDays"]).to_numpy()) / sold,
+            "OpenHoldingDays": total(open_codes, open_lots["Quantity"].to_numpy() * open_age) / open_qty,
+        }, index=pd.Index(tx.tickers, name="Ticker"))
+
+    if prices is not None:
+        summary["MarketPrice"] = pd.Series(prices, dtype=float).reindex(summary.index)
+        summary["MarketValue"] = summary["OpenQuantity"] * summary["MarketPrice"]
+        summary["UnrealizedPnL"] = summary["MarketValue"] - summary["OpenCost"]
+    return summary
+
+
+def match_lots(df: pd.DataFrame, method: str = "fifo", prices: Optional[dict] = None,
+               as_of: Optional[pd.Timestamp] = None) -> CostBasisResult:
+    """Match the buys and sells of a portfolio and summarize the cost basis.
+
+    Args:
+        df: Transactions with Ticker, Date, Action, Quantity and Price
+            columns (Date may be the index). Actions other than buy/sell
+            are ignored.
+        method: "fifo", "lifo" or "average".
+        prices: Latest price per ticker, used for unrealized P&L.
+        as_of: Date open holding periods are measured to. Defaults to now.
+    """
+    if method not in METHODS:
+        raise ValueError(f"Unknown cost basis method {method!r}, expected one of {METHODS}.")
+
+    tx = _prepare(df)
+    if method == "fifo":
+        lots, open_lots = _match_fifo(tx)
+    elif method == "lifo":
+        lots, open_lots = _match_lifo(tx)
+    else:
+        lots, open_lots = _match_average(tx)
+
+    as_of = pd.Timestamp.now() if as_of is None else pd.Timestamp(as_of)
+    return CostBasisResult(lots, open_lots, _summarize(tx, lots, open_lots, prices, as_of))
+
+
+def latest_prices(market_data) -> dict:
+    """Reduce market data to a price per ticker.
+
+    Accepts a dict of prices, or a dict of OHLCV frames as produced by
+    YahooNode, in which case the last Close is used.
+    """
+    prices = {}
+    for ticker, value in market_data.items():
+        if isinstance(value, pd.DataFrame):
+            close = value["Close"].dropna() if "Close" in value else None
+            prices[ticker] = float(close.iloc[-1]) if close is not None and not close.empty else np.nan
+        else:
+            prices[ticker] = value
+    return prices
+
+
+class CostBasis(Node):
+    """Per-ticker cost basis, realized/unrealized P&L and holding periods.
+
+    Connect a portfolio DataFrame alone, or a portfolio and market data as a
+    join (portfolio first) to also get unrealized P&L.
+    """
+
+    def __init__(self, method: str = "fifo", is_output: bool = False):
+        super().__init__((pd.DataFrame,), pd.DataFrame, is_output=is_output)
+        if method not in METHODS:
+            raise ValueError(f"Unknown cost basis method {method!r}, expected one of {METHODS}.")
+        self.method = method
+
+    def process(self, _input) -> pd.DataFrame:
+        prices = None
+        if isinstance(_input, tuple):
+            _input, market_data = _input
+            prices = latest_prices(market_data)
+        return match_lots(_input, self.method, prices).summary
@@ -0,0 +1,252 @@
+"""profiling.py - per-node timing and resource usage for PipelineRunner.
+
+Pass a Profiler to PipelineRunner(profiler=...) and every node execution is
+measured: wall and CPU time, the peak of memory allocated while it ran
+(tracemalloc), the rows and bytes going in and out, whether the result came
+from the cache, and how many fetches exponential_backoff or the fetch
+scheduler had to retry on its behalf. Results can be written as a JSON
+report or as a Chrome trace (chrome://tracing, https://ui.perfetto.dev), and
+Graph.print_graph(profile=...) colours nodes by the time they took.
+
+Memory numbers come from the process-wide tracemalloc counters, so in a
+thread-parallel run they include whatever the other nodes allocated at the
+same time. tracemalloc is only left on while some node is being measured: a
+profiler that had to start it stops it again once the last measurement in
+the process ends, and tracing someone else started is left alone.
+"""
+import contextvars
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import defaultdict
+from typing import Dict, List
+
+
+class _State:
+    """Profiling state shared by every copy of this module in the process."""
+
+    def __init__(self):
+        # The record of the node running in the current context, so code deep
+        # inside a node, like a data source's retry loop, can report to it.
+        self.current = contextvars.ContextVar("profiling_current_node", default=None)
+        # Measurements in flight, and whether tracemalloc was started for them
+        # and so should be stopped when they are done.
+        self.memory_lock = threading.Lock()
+        self.memory_users = 0
+        self.memory_started = False
+
+
+def _shared_state() -> _State:
+    # This file is imported as "profiling" next to the runners and as part of
+    # the package by the data sources, which makes two module objects. The
+    # one imported second adopts the state of the first, so a retry recorded
+    # through either reaches the Profiler created from the other.
+    here = os.path.realpath(__file__)
+    for module in list(sys.modules.values()):
+        state = getattr(module, "_state", None)
+        path = getattr(module, "__file__", None)
+        if state is not None and path and os.path.realpath(path) == here:
+            return state
+    return _State()
+
+
+_state = _shared_state()
+
+
+def record_retry():
+    """Count a retried attempt against the node currently being profiled."""
+    record = _state.current.get()
+    if record is not None:
+        record["retries"] += 1
+
+
+def measure_size(value):
+    """Return (rows, bytes) of a node input or output; either may be None."""
+    if value is None:
+        return 0, 0
+    if isinstance(value, tuple):
+        sizes = [measure_size(item) for item in value]
+        return sum(rows or 0 for rows, _ in sizes), sum(size or 0 for _, size in sizes)
+
+    if hasattr(value, "memory_usage") and hasattr(value, "shape"):
+        # DataFrame.memory_usage is per column, Series.memory_usage a scalar.
+        usage = value.memory_usage(deep=True)
+        return len(value), int(usage.sum() if hasattr(usage, "sum") else usage)
+    if hasattr(value, "nbytes"):
+        return (len(value) if getattr(value, "ndim", 0) else 1), int(value.nbytes)
+    try:
+        rows = len(value)
+    except TypeError:
+        rows = None
+    return rows, sys.getsizeof(value)
+
+
+class Profiler:
+    """Collects one record per node execution.
+
+    Args:
+        trace_memory: Track peak allocations with tracemalloc. This slows
+            allocation-heavy nodes down noticeably, so it can be turned off.
+        measure_sizes: Work out rows and bytes of every input and output.
+            Sizing object columns means walking every value.
+    """
+
+    def __init__(self, trace_memory: bool = True, measure_sizes: bool = True):
+        self.trace_memory = trace_memory
+        self.measure_sizes = measure_sizes
+        self.records: List[dict] = []
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        # Only the settings travel to worker processes; records stay here.
+        return {"trace_memory": self.trace_memory, "measure_sizes": self.measure_sizes}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def call(self, node, _input):
+        """Run node.process(_input), returning (output, record).
+
+        Safe to submit to a process pool: the record comes back with the
+        output and the caller hands it to add.
+        """
+        record = self._start(node, _input)
+        token = _state.current.set(record)
+        tracing = self._start_memory()
+        start, cpu = time.perf_counter(), time.thread_time()
+        try:
+            output = node.process(_input)
+        finally:
+            record["wall"] = time.perf_counter() - start
+            record["cpu"] = time.thread_time() - cpu
+            record["memory"] = self._stop_memory(tracing)
+            _state.current.reset(token)
+        self._finish(record, output)
+        return output, record
+
+    async def call_async(self, node, _input):
+        """Await a coroutine node.process, returning (output, record).
+
+        Other coroutines share the thread while it waits, so CPU time and
+        memory are not attributed and stay None.
+        """
+        record = self._start(node, _input)
+        token = _state.current.set(record)
+        start = time.perf_counter()
+        try:
+            output = await node.process(_input)
+        finally:
+            record["wall"] = time.perf_counter() - start
+            _state.current.reset(token)
+        self._finish(record, output)
+        return output, record
+
+    def add(self, record: dict):
+        """Keep a record produced by call or call_async."""
+        with self._lock:
+            self.records.append(record)
+
+    def cache_hit(self, node, output):
+        """Record that node's output came from the cache."""
+        record = self._start(node, None)
+        record["cache_hit"] = True
+        self._finish(record, output)
+        self.add(record)
+
+    def summary(self) -> Dict[str, dict]:
+        """Aggregate the records by node id.
+
+        Times, retries and cache hits are summed over every execution,
+        memory is the largest peak seen and sizes are from the last run.
+        """
+        summary = {}
+        for record in self.records:
+            entry = summary.setdefault(record["node"], {
+                "name": record["name"], "calls": 0, "cache_hits": 0, "retries": 0,
+                "wall": 0.0, "cpu": 0.0, "memory": None,
+            })
+            entry["calls"] += 1
+            entry["cache_hits"] += record["cache_hit"]
+            entry["retries"] += record["retries"]
+            entry["wall"] += record["wall"]
+            entry["cpu"] += record["cpu"] or 0.0
+            if record["memory"] is not None:
+                entry["memory"] = max(entry["memory"] or 0, record["memory"])
+            for key in ("input_rows", "input_bytes", "output_rows", "output_bytes"):
+                entry[key] = record[key]
+        return summary
+
+    def wall_times(self) -> Dict[str, float]:
+        """Total wall time per node id."""
+        totals = defaultdict(float)
+        for record in self.records:
+            totals[record["node"]] += record["wall"]
+        return dict(totals)
+
+    def write_json(self, path: str):
+        """Write the per-node summary and every raw record as JSON."""
+        with open(path, "w") as f:
+            json.dump({"nodes": self.summary(), "records": self.records}, f, indent=2, default=str)
+
+    def write_chrome_trace(self, path: str):
+        """Write the records in the Chrome trace-event format.
+
+        Each execution is a complete ("X") event on the process and thread
+        that ran it, so parallel branches show up side by side.
+        """
+        events = [{
+            "name": record["name"],
+            "cat": "cache" if record["cache_hit"] else "node",
+            "ph": "X",
+            "ts": record["start"] * 1e6,
+            "dur": record["wall"] * 1e6,
+            "pid": record["pid"],
+            "tid": record["tid"],
+            "args": {key: value for key, value in record.items() if key not in ("start", "pid", "tid")},
+        } for record in self.records]
+        with open(path, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f, default=str)
+
+    def _start(self, node, _input) -> dict:
+        record = {
+            "node": node.id, "name": node.__class__.__name__,
+            "start": time.time(), "pid": os.getpid(), "tid": threading.get_ident(),
+            "wall": 0.0, "cpu": None, "memory": None,
+            "input_rows": None, "input_bytes": None, "output_rows": None, "output_bytes": None,
+            "cache_hit": False, "retries": 0,
+        }
+        if self.measure_sizes and _input is not None:
+            record["input_rows"], record["input_bytes"] = measure_size(_input)
+        return record
+
+    def _finish(self, record: dict, output):
+        if self.measure_sizes:
+            record["output_rows"], record["output_bytes"] = measure_size(output)
+
+    def _start_memory(self):
+        """Begin a peak measurement; returns the baseline, or None if off."""
+        if not self.trace_memory:
+            return None
+        with _state.memory_lock:
+            if not _state.memory_users and not tracemalloc.is_tracing():
+                tracemalloc.start()
+                _state.memory_started = True
+            _state.memory_users += 1
+        tracemalloc.reset_peak()
+        return tracemalloc.get_traced_memory()[0]
+
+    @staticmethod
+    def _stop_memory(baseline):
+        if baseline is None:
+            return None
+        peak = max(0, tracemalloc.get_traced_memory()[1] - baseline)
+        with _state.memory_lock:
+            _state.memory_users -= 1
+            if not _state.memory_users and _state.memory_started:
+                tracemalloc.stop()
+                _state.memory_started = False
+        return peak
+
@@ -1 +1,257 @@
-"""create_report.py - Given a backing DataFrame, return a report of the portfolio."""
+"""create_report.py - Given a backing DataFrame, return a report of the portfolio.
+
+Every ticker's close series is aligned into one dates x tickers price matrix
+so returns, volatility, drawdown, beta and correlation are computed for all
+tickers at once with NumPy instead of one ticker at a time. Missing bars are
+NaN; prices are carried forward over gaps, and statistics only use the days
+a ticker actually has data.
+"""
+from typing import NamedTuple, Optional
+
+import numpy as np
+import pandas as pd
+
+from pipeline2.node import Node
+
+TRADING_DAYS = 252
+
+
+class PortfolioAnalytics(NamedTuple):
+    prices: pd.DataFrame        # dates x tickers closes, forward filled
+    returns: pd.DataFrame       # dates x tickers daily returns, NaN before a ticker's first bar
+    volatility: pd.DataFrame    # dates x tickers rolling annualized volatility
+    correlation: pd.DataFrame   # tickers x tickers correlation of daily returns
+    portfolio: pd.DataFrame     # per date Value, Return and Drawdown of the holdings
+    summary: pd.DataFrame       # one row per ticker
+
+
+def price_matrix(market_data, column: str = "Close") -> pd.DataFrame:
+    """Align the close series of every ticker into one dates x tickers frame.
+
+    Accepts a dict of OHLCV frames (as YahooNode produces), a dict of Series,
+    a frame with (ticker, field) column levels, or a frame that already has
+    one column per ticker.
+    """
+    if isinstance(market_data, pd.DataFrame):
+        if isinstance(market_data.columns, pd.MultiIndex):
+            return market_data.xs(column, axis=1, level=1).sort_index()
+        return market_data.sort_index()
+
+    series = {}
+    for ticker, value in market_data.items():
+        if isinstance(value, pd.DataFrame):
+            if column in value:
+                series[ticker] = value[column]
+        elif isinstance(value, pd.Series):
+            series[ticker] = value
+    if not series:
+        return pd.DataFrame(dtype=float)
+
+    # One shared calendar, then each ticker is dropped into place by position.
+    stamps = [pd.DatetimeIndex(s.index).asi8 for s in series.values()]
+    values = [s.to_numpy(dtype=float) for s in series.values()]
+    if all(len(x) == len(stamps[0]) and np.array_equal(x, stamps[0]) for x in stamps[1:]) \
+            and np.all(np.diff(stamps[0]) > 0):
+        return pd.DataFrame(np.column_stack(values), index=pd.DatetimeIndex(stamps[0]), columns=list(series))
+
+    dates, rows = np.unique(np.concatenate(stamps), return_inverse=True)
+    columns = np.repeat(np.arange(len(stamps)), [len(x) for x in stamps])
+    matrix = np.full((len(dates), len(series)), np.nan)
+    matrix[rows.ravel(), columns] = np.concatenate(values)
+    return pd.DataFrame(matrix, index=pd.DatetimeIndex(dates), columns=list(series))
+
+
+def _ffill(matrix: np.ndarray) -> np.ndarray:
+    """Carry the last valid value of every column forward."""
+    missing = np.isnan(matrix)
+    if not missing.any():
+        return matrix
+    rows = np.where(missing, 0, np.arange(len(matrix))[:, None])
+    np.maximum.accumulate(rows, axis=0, out=rows)
+    return matrix[rows, np.arange(matrix.shape[1])]
+
+
+def _beta(returns: np.ndarray, market: np.ndarray) -> np.ndarray:
+    """Beta of every column against market, over the days both have data."""
+    mask = ~(np.isnan(returns) | np.isnan(market)[:, None])
+    x = np.where(mask, returns, 0.0)
+    y = np.where(mask, np.nan_to_num(market)[:, None], 0.0)
+    n = mask.sum(axis=0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        cov = (np.einsum("ij,ij->j", x, y) - x.sum(axis=0) * y.sum(axis=0) / n) / (n - 1)
+        var = (np.einsum("ij,ij->j", y, y) - y.sum(axis=0) ** 2 / n) / (n - 1)
+        return cov / var
+
+
+def _std(returns: np.ndarray) -> np.ndarray:
+    """Sample standard deviation of every column, ignoring NaN."""
+    valid = ~np.isnan(returns)
+    values = np.where(valid, returns, 0.0)
+    n = valid.sum(axis=0)
+    s = values.sum(axis=0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        var = (np.einsum("ij,ij->j", values, values) - s * s / n) / (n - 1)
+    return np.where(n > 1, np.sqrt(np.maximum(var, 0.0)), np.nan)
+
+
+def _window_sums(values: np.ndarray, window: int) -> np.ndarray:
+    """Sum of each column over the last window rows, for every row."""
+    sums = np.cumsum(values, axis=0)
+    sums[window:] -= sums[:-window].copy()
+    return sums
+
+
+def _rolling_std(returns: np.ndarray, window: int) -> np.ndarray:
+    """Sample standard deviation over the last window rows, ignoring NaN."""
+    valid = ~np.isnan(returns)
+    values = np.where(valid, returns, 0.0)
+    if valid.all():
+        n = np.minimum(np.arange(1, len(values) + 1), window)[:, None].astype(float)
+    else:
+        n = _window_sums(valid.astype(float), window)
+    s = _window_sums(values, window)
+    squares = _window_sums(values * values, window)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        var = (squares - s * s / n) / (n - 1)
+    std = np.sqrt(np.maximum(var, 0.0))
+    return np.where(n < 2, np.nan, std)
+
+
+def _correlation(returns: np.ndarray) -> np.ndarray:
+    """Correlation of every pair of columns using the days both have data.
+
+    Columns are centred on their own means rather than per pair, which
+    matches pandas exactly when the tickers share a calendar and stays close
+    otherwise, but costs one or two matrix products instead of a pass per pair.
+    """
+    valid = ~np.isnan(returns)
+    counts = valid.sum(axis=0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        means = np.where(valid, returns, 0.0).sum(axis=0) / counts
+        centred = np.where(valid, returns - means, 0.0)
+        cross = centred.T @ centred
+        if valid.all():
+            scale = np.sqrt(np.diag(cross))
+            corr = cross / np.outer(scale, scale)
+        else:
+            # squares[i, j]: column i's squared deviations over the days j has data too.
+            squares = (centred * centred).T @ valid.astype(float)
+            corr = cross / np.sqrt(squares * squares.T)
+    np.fill_diagonal(corr, np.where(counts > 1, 1.0, np.nan))
+    return corr
+
+
+def analyze(market_data, holdings: Optional[dict] = None, prices: Optional[dict] = None,
+            benchmark: Optional[str] = None, window: int = 21) -> PortfolioAnalytics:
+    """Compute the analytics of every ticker in market_data at once.
+
+    Args:
+        market_data: Anything price_matrix accepts.
+        holdings: Shares held per ticker; weights the portfolio series and
+            market value. Defaults to one share of each ticker.
+        prices: Latest quotes that override the last close for market value.
+        benchmark: Ticker whose returns beta is measured against. Defaults to
+            the returns of the portfolio itself.
+        window: Days in the rolling volatility window.
+    """
+    if window < 2:
+        raise ValueError(f"window must be at least 2 days, got {window}.")
+    frame = price_matrix(market_data)
+    if holdings:
+        # Held tickers without bars still count, at their quoted price.
+        frame = frame.reindex(columns=list(frame.columns) + [t for t in holdings if t not in frame.columns])
+    tickers = list(frame.columns)
+    raw = frame.to_numpy(dtype=float)
+    closes = _ffill(raw)
+
+    returns = np.full_like(closes, np.nan)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        returns[1:] = closes[1:] / closes[:-1] - 1
+    if closes is not raw:
+        # A carried forward price is not a trading day.
+        returns[np.isnan(raw)] = np.nan
+
+    quantity = np.array([(holdings or {}).get(ticker, 0.0 if holdings else 1.0) for ticker in tickers], dtype=float)
+    value = np.nan_to_num(closes) @ quantity
+    # Weight each day's returns by the value held going into it, so a ticker
+    # whose bars start later does not show up as a jump in the portfolio.
+    held = np.nan_to_num(closes[:-1]) * quantity
+    portfolio_returns = np.full_like(value, np.nan)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        portfolio_returns[1:] = np.einsum("ij,ij->i", np.nan_to_num(returns[1:]), held) / held.sum(axis=1)
+        portfolio_drawdown = value / np.fmax.accumulate(value) - 1
+
+    if benchmark is not None:
+        if benchmark not in frame:
+            raise ValueError(f"Benchmark {benchmark!r} is not in the market data.")
+        market = returns[:, tickers.index(benchmark)]
+    else:
+        market = portfolio_returns
+
+    # The first row never has a return; leaving it out keeps the gap-free fast paths.
+    rolling = np.full_like(returns, np.nan)
+    rolling[1:] = _rolling_std(returns[1:], window) * np.sqrt(TRADING_DAYS)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        drawdown = closes / np.fmax.accumulate(closes, axis=0) - 1
+
+    first = last = np.full(len(tickers), np.nan)
+    if len(raw):
+        # argmax finds each column's first bar; columns without any stay NaN.
+        first = raw[np.argmax(~np.isnan(raw), axis=0), np.arange(len(tickers))]
+        last = closes[-1]
+    if prices:
+        last = np.array([price if prices.get(ticker) is None else prices[ticker]
+                         for ticker, price in zip(tickers, last)], dtype=float)
+    market_value = quantity * last
+    total = np.nansum(market_value)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        summary = pd.DataFrame({
+            "LastPrice": last,
+            "Quantity": quantity,
+            "MarketValue": market_value,
+            "Weight": market_value / total if total else np.nan,
+            "PeriodReturn": last / first - 1,
+            "Volatility": _std(returns) * np.sqrt(TRADING_DAYS),
+            "RollingVolatility": rolling[-1] if len(rolling) else np.nan,
+            "MaxDrawdown": np.fmin.reduce(drawdown, axis=0) if len(drawdown) else np.nan,
+            "Beta": _beta(returns, market),
+        }, index=pd.Index(tickers, name="Ticker"))
+
+    return PortfolioAnalytics(
+        prices=pd.DataFrame(closes, index=frame.index, columns=tickers),
+        returns=pd.DataFrame(returns, index=frame.index, columns=tickers),
+        volatility=pd.DataFrame(rolling, index=frame.index, columns=tickers),
+        correlation=pd.DataFrame(_correlation(returns[1:]), index=tickers, columns=tickers),
+        portfolio=pd.DataFrame({"Value": value, "Return": portfolio_returns, "Drawdown": portfolio_drawdown},
+                               index=frame.index),
+        summary=summary,
+    )
+
+
+def holdings_from_portfolio(df: pd.DataFrame) -> dict:
+    """Net shares held per ticker; sells count negative."""
+    sells = df["Action"].astype(str).str.lower().str.startswith("sell").to_numpy()
+    quantity = pd.to_numeric(df["Quantity"]).to_numpy(dtype=float)
+    signed = pd.Series(np.where(sells, -quantity, quantity), index=df["Ticker"].astype(str).to_numpy())
+    return signed.groupby(level=0).sum().to_dict()
+
+
+class CreateReport(Node):
+    """Per-ticker market value, returns, volatility, drawdown and beta.
+
+    Connect market data alone, or a portfolio and market data as a join
+    (portfolio first) to weight by the shares actually held.
+    """
+
+    def __init__(self, benchmark: str = None, window: int = 21, is_output: bool = False):
+        super().__init__((pd.DataFrame,), pd.DataFrame, is_output=is_output)
+        self.benchmark = benchmark
+        self.window = window
+
+    def process(self, _input) -> pd.DataFrame:
+        holdings = None
+        if isinstance(_input, tuple):
+            portfolio, _input = _input
+            holdings = holdings_from_portfolio(portfolio)
+        return analyze(_input, holdings, benchmark=self.benchmark, window=self.window).summary
@@ -0,0 +1,104 @@
+"""transport.py - Hand large outputs between worker processes without pickling them through a pipe.
+
+A process pool normally pickles a node's input into the worker and its output
+back out, copying every byte of a DataFrame through a pipe twice. With a
+SharedMemoryTransport, a worker pickles its output with protocol 5, which
+leaves the NumPy buffers behind a DataFrame, Series or array out of band.
+Those buffers are written once to a file in shared memory (/dev/shm where
+available), and only a small SharedPayload travels back to the runner. The
+next worker maps that file copy-on-write, so it sees the data without
+another copy and may still modify its view freely.
+
+The runner unlinks a payload's file once every consumer of the output has
+finished, or at the end of the run.
+"""
+import mmap
+import os
+import pickle
+import tempfile
+from typing import NamedTuple, Tuple
+
+
+class SharedPayload(NamedTuple):
+    """A pickled value whose large buffers live in a shared file."""
+    path: str
+    header: bytes
+    lengths: Tuple[int, ...]
+
+
+def _default_directory():
+    # /dev/shm is RAM backed on Linux; elsewhere fall back to the temp dir.
+    return "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+
+
+class SharedMemoryTransport:
+    """Moves values of at least threshold bytes through shared files.
+
+    Args:
+        threshold: Smaller values are pickled as usual, since a file costs
+            more than copying a few kilobytes.
+        directory: Where payload files are created.
+    """
+
+    def __init__(self, threshold: int = 1 << 20, directory: str = None):
+        self.threshold = threshold
+        self.directory = directory or _default_directory()
+
+    def pack(self, value):
+        """Return a SharedPayload for value, or value itself if it is small."""
+        if value is None or isinstance(value, SharedPayload):
+            return value
+
+        buffers = []
+        header = pickle.dumps(value, protocol=5, buffer_callback=buffers.append)
+        raws = [buffer.raw() for buffer in buffers]
+        if sum(raw.nbytes for raw in raws) < self.threshold:
+            return value
+
+        fd, path = tempfile.mkstemp(prefix="pipeline-", suffix=".buf", dir=self.directory)
+        with os.fdopen(fd, "wb") as f:
+            for raw in raws:
+                f.write(raw)
+        return SharedPayload(path, header, tuple(raw.nbytes for raw in raws))
+
+    @staticmethod
+    def unpack(value):
+        """Rebuild a packed value, mapping its buffers instead of reading them."""
+        if isinstance(value, tuple) and not isinstance(value, SharedPayload):
+            return tuple(SharedMemoryTransport.unpack(item) for item in value)
+        if not isinstance(value, SharedPayload):
+            return value
+
+        with open(value.path, "rb") as f:
+            # Copy-on-write: writes stay private to this process.
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+        view = memoryview(mapped)
+        buffers = []
+        offset = 0
+        for length in value.lengths:
+            buffers.append(view[offset:offset + length])
+            offset += length
+        return pickle.loads(value.header, buffers=buffers)
+
+    @staticmethod
+    def discard(value):
+        """Remove a payload's file; existing mappings stay valid until dropped."""
+        if isinstance(value, SharedPayload):
+            try:
+                os.unlink(value.path)
+            except OSError:
+                pass
+
+    def call(self, func, *args, result: str = "value"):
+        """Worker side: unpack the last argument, call func, pack what it returns.
+
+        result says what func returns: "value" is a single output, "list" a
+        fused chain's list of outputs and "profiled" Profiler.call's
+        (output, record) pair, of which only the output is packed.
+        """
+        returned = func(*args[:-1], self.unpack(args[-1]))
+        if result == "list":
+            return [self.pack(output) for output in returned]
+        if result == "profiled":
+            return self.pack(returned[0]), returned[1]
+        return self.pack(returned)